@@ -1,8 +1,22 @@
-from . import animations, results, simulate
+from . import animations, recorder, results, simulate
 from .animations import draw, ring  # noqa F401
-from .results import aggregate, confidence_interval, intersect, loader, normalized, percolate, zipdir  # noqa F401
+from .recorder import Recorder  # noqa F401
+from .results import (  # noqa F401
+    ColumnarWriter,
+    MemmapOutput,
+    aggregate,
+    columnar_header,
+    columnar_loader,
+    confidence_interval,
+    convert,
+    intersect,
+    loader,
+    normalized,
+    percolate,
+    zipdir,
+)
 from .simulate import CollisionException, batch, main  # noqa F401
 
-__all__ = ["animations", "ring", "results", "simulate", "batch"]
+__all__ = ["animations", "ring", "recorder", "Recorder", "results", "simulate", "batch"]
 
 __version__ = "0.0.0"
@@ -1 +1,2 @@
-from .contact_distance import calc_dtc, ellipses  # noqa F401
+from .contact_distance import calc_dtc, ellipses, ellipses_derivative, ellipses_many, quartic  # noqa F401
+from .table import EXACT, contact_table, ellipses_lookup, interpolate  # noqa F401
@@ -1,7 +1,10 @@
 from math import atan2, cos, sin, sqrt
 
 import numpy as np
-from numba import jit
+from numba import jit, prange
+
+# Machine epsilon, for the tolerance of the root finding
+EPS = np.finfo(np.float64).eps
 
 
 @jit(nopython=True)
@@ -126,10 +129,8 @@ def ellipses(
         C = -t - (1 + deltap) ** 2 + 1 / b2p**2 * (1 + t + deltap * t)
         D = 2 / b2p * (1 + t) * (1 + deltap)
         E = (1 + t + deltap) * (1 + deltap)
-        # https://github.com/numba/numba/issues/3568
-        # coeffs are now in an array, and the dtype is complex space.
-        rts = np.real(np.roots(np.array([A, B, C, D, E], dtype=np.complex128)))
-        qq = rts[rts > 0][0]
+        # the positive root of the quartic
+        qq = quartic(A, B, C, D, E)
         # substitute for R'
         Rc = sqrt(
             (qq**2 - 1) / deltap * (1 + b2p * (1 + deltap) / qq) ** 2 + (1 - (qq**2 - 1) / deltap) * (1 + b2p / qq) ** 2
@@ -137,3 +138,197 @@ def ellipses(
         # The distance of closest approach
         dist = Rc * b1 / sqrt(1 - e1 * k1d**2)
         return dist
+
+
+@jit(nopython=True)
+def ellipses_derivative(
+    a1: float,
+    b1: float,
+    a2: float,
+    b2: float,
+    x1: float,
+    y1: float,
+    x2: float,
+    y2: float,
+    theta1: float,
+    theta2: float,
+) -> tuple:
+    """Distance of closest approach of two ellipses and its derivative
+
+    Same as ellipses, with the derivative of the distance with respect to the angle of the line
+    joining the centers (theta3), obtained by differentiating every step of the computation
+    (the root of the quartic by implicit differentiation). Only kpmp depends on theta3.
+
+    Args:
+        a1 (float): length of major semiaxis of first ellipse
+        b1 (float): length of minor semiaxis of first ellipse
+        a2 (float): length of major semiaxis of second ellipse
+        b2 (float): length of minor semiaxis of second ellipse
+        x1 (float): x coordinate of the center of the first ellipse
+        y1 (float): y coordinate of the center of the first ellipse
+        x2 (float): x coordinate of the center of the second ellipse
+        y2 (float): y coordinate of the center of the second ellipse
+        theta1 (float): angle associated with the major axis of first ellipse
+        theta2 (float): angle associated with the major axis of second ellipse
+
+    Returns:
+        tuple: distance between the centers when two ellipses are externally tangent and its
+        derivative with respect to theta3
+    """
+    theta3 = atan2(y2 - y1, x2 - x1)
+    k1d = cos(theta3 - theta1)
+    k2d = cos(theta3 - theta2)
+    k1k2 = cos(theta2 - theta1)
+    dk1d = -sin(theta3 - theta1)
+    dk2d = -sin(theta3 - theta2)
+    # eccentricity of ellipses
+    e1 = 1 - (b1**2 / a1**2)
+    e2 = 1 - (b2**2 / a2**2)
+    # component of A'
+    eta = a1 / b1 - 1
+    a11 = b1**2 / b2**2 * (1 + 0.5 * (1 + k1k2) * (eta * (2 + eta) - e2 * (1 + eta * k1k2) ** 2))
+    a12 = b1**2 / b2**2 * 0.5 * sqrt(1 - k1k2**2) * (eta * (2 + eta) + e2 * (1 - eta**2 * k1k2**2))
+    a22 = b1**2 / b2**2 * (1 + 0.5 * (1 - k1k2) * (eta * (2 + eta) - e2 * (1 - eta * k1k2) ** 2))
+    # eigenvalues of A'
+    lambda1 = 0.5 * (a11 + a22) + 0.5 * sqrt((a11 - a22) ** 2 + 4 * a12**2)
+    lambda2 = 0.5 * (a11 + a22) - 0.5 * sqrt((a11 - a22) ** 2 + 4 * a12**2)
+    # major and minor axes of transformed ellipse
+    b2p = 1 / sqrt(lambda1)
+    a2p = 1 / sqrt(lambda2)
+    deltap = a2p**2 / b2p**2 - 1
+    g = sqrt(1 - e1 * k1d**2)
+    dg = -e1 * k1d * dk1d / g
+    if abs(k1k2) == 1:
+        if a11 > a22:
+            num, dnum = b1 / a1 * k1d, b1 / a1 * dk1d
+        else:
+            num, dnum = sin(theta3 - theta1), cos(theta3 - theta1)
+        kpmp = num / g
+        dkpmp = (dnum * g - num * dg) / g**2
+    elif deltap != 0:
+        c1 = a12 / sqrt(1 + k1k2)
+        c2 = (lambda1 - a11) / sqrt(1 - k1k2)
+        u = b1 / a1 * k1d + k2d + (b1 / a1 - 1) * k1d * k1k2
+        v = b1 / a1 * k1d - k2d - (b1 / a1 - 1) * k1d * k1k2
+        du = b1 / a1 * dk1d + dk2d + (b1 / a1 - 1) * dk1d * k1k2
+        dv = b1 / a1 * dk1d - dk2d - (b1 / a1 - 1) * dk1d * k1k2
+        K = sqrt(2 * (a12**2 + (lambda1 - a11) ** 2))
+        kpmp = (c1 * u + c2 * v) / (K * g)
+        dkpmp = ((c1 * du + c2 * dv) * g - (c1 * u + c2 * v) * dg) / (K * g**2)
+    else:
+        kpmp = 0
+        dkpmp = 0
+    if kpmp == 0 or deltap == 0:
+        Rc = a2p + 1
+        # The distance of closest approach
+        dist = Rc * b1 / g
+        return dist, -Rc * b1 * dg / g**2
+    # coefficients of quartic for q
+    t = 1 / kpmp**2 - 1
+    dt = -2 * dkpmp / kpmp**3
+    A = -1 / b2p**2 * (1 + t)
+    B = -2 / b2p * (1 + t + deltap)
+    C = -t - (1 + deltap) ** 2 + 1 / b2p**2 * (1 + t + deltap * t)
+    D = 2 / b2p * (1 + t) * (1 + deltap)
+    E = (1 + t + deltap) * (1 + deltap)
+    qq = quartic(A, B, C, D, E)
+    # implicit derivative of the root
+    dP = (
+        -(qq**4) / b2p**2 - 2 * qq**3 / b2p + (-1 + (1 + deltap) / b2p**2) * qq**2 + 2 / b2p * (1 + deltap) * qq
+    ) * dt + (1 + deltap) * dt
+    dPdq = 4 * A * qq**3 + 3 * B * qq**2 + 2 * C * qq + D
+    dqq = -dP / dPdq
+    # substitute for R'
+    h1 = 1 + b2p * (1 + deltap) / qq
+    h2 = 1 + b2p / qq
+    Rc = sqrt((qq**2 - 1) / deltap * h1**2 + (1 - (qq**2 - 1) / deltap) * h2**2)
+    dF = (
+        2 * qq / deltap * h1**2
+        - (qq**2 - 1) / deltap * 2 * h1 * b2p * (1 + deltap) / qq**2
+        - 2 * qq / deltap * h2**2
+        - (1 - (qq**2 - 1) / deltap) * 2 * h2 * b2p / qq**2
+    )
+    dRc = dF * dqq / (2 * Rc)
+    # The distance of closest approach
+    dist = Rc * b1 / g
+    return dist, b1 * (dRc * g - Rc * dg) / g**2
+
+
+@jit(nopython=True)
+def quartic(A: float, B: float, C: float, D: float, E: float) -> float:
+    """Positive root of the quartic for q of the distance of closest approach
+
+    With E > 0 and A < 0, the quartic A q^4 + B q^3 + C q^2 + D q + E has a single positive root,
+    which lies between 0 and the Cauchy bound of the roots. It is found by Newton's method
+    safeguarded by bisection, down to machine precision, instead of computing all the roots
+    as the eigenvalues of the companion matrix.
+
+    Args:
+        A (float): coefficient of q^4
+        B (float): coefficient of q^3
+        C (float): coefficient of q^2
+        D (float): coefficient of q
+        E (float): constant coefficient
+
+    Returns:
+        float: the positive root
+    """
+    lo = 0.0
+    hi = 1 + max(abs(B), abs(C), abs(D), abs(E)) / abs(A)
+    q = hi
+    for _ in range(100):
+        P = (((A * q + B) * q + C) * q + D) * q + E
+        dP = ((4 * A * q + 3 * B) * q + 2 * C) * q + D
+        if P > 0:
+            lo = q
+        elif P < 0:
+            hi = q
+        else:
+            return q
+        step = q - P / dP if dP != 0 else np.nan
+        if not lo < step < hi:
+            step = 0.5 * (lo + hi)
+        if abs(step - q) <= 4 * EPS * step:
+            return step
+        q = step
+    return q
+
+
+@jit(nopython=True, parallel=True)
+def ellipses_many(
+    a1: np.ndarray,
+    b1: np.ndarray,
+    a2: np.ndarray,
+    b2: np.ndarray,
+    x1: np.ndarray,
+    y1: np.ndarray,
+    x2: np.ndarray,
+    y2: np.ndarray,
+    theta1: np.ndarray,
+    theta2: np.ndarray,
+    out: np.ndarray,
+) -> np.ndarray:
+    """Distances of closest approach of many pairs of ellipses
+
+    Meant for pairs known in advance, such as the nodes of the contact tables (see build). The
+    simulation loops call ellipses instead, only for the pairs that pass their cheaper filters.
+
+    Args:
+        a1 (np.ndarray): lengths of major semiaxis of first ellipses
+        b1 (np.ndarray): lengths of minor semiaxis of first ellipses
+        a2 (np.ndarray): lengths of major semiaxis of second ellipses
+        b2 (np.ndarray): lengths of minor semiaxis of second ellipses
+        x1 (np.ndarray): x coordinates of the centers of the first ellipses
+        y1 (np.ndarray): y coordinates of the centers of the first ellipses
+        x2 (np.ndarray): x coordinates of the centers of the second ellipses
+        y2 (np.ndarray): y coordinates of the centers of the second ellipses
+        theta1 (np.ndarray): angles associated with the major axis of first ellipses
+        theta2 (np.ndarray): angles associated with the major axis of second ellipses
+        out (np.ndarray): output array, one element per pair
+
+    Returns:
+        np.ndarray: out, filled with the distances between the centers when the ellipses are externally tangent
+    """
+    for k in prange(len(out)):
+        out[k] = ellipses(a1[k], b1[k], a2[k], b2[k], x1[k], y1[k], x2[k], y2[k], theta1[k], theta2[k])
+    return out
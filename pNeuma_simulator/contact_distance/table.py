@@ -0,0 +1,205 @@
+import os
+from math import atan2, floor, pi
+
+import numpy as np
+from numba import jit
+
+from pNeuma_simulator import params
+from pNeuma_simulator.contact_distance.contact_distance import ellipses_many
+
+# Shapes of the vehicles, indexed by kind (0 for cars, 1 for motorcycles)
+SHAPES = ((params.car_l, params.car_w), (params.moto_l, params.moto_w))
+# Empty table, standing for the exact contact distance
+EXACT = np.empty((2, 2, 0, 0))
+
+
+def contact_table(tolerance: float = params.contact_tolerance, cache: str | bool | None = None) -> np.ndarray:
+    """Load the tables of the contact distance, building and caching them if needed.
+
+    The cached tables are memory-mapped, so that the workers share the pages of a single file.
+
+    Args:
+        tolerance (float, optional): bound of the interpolation error in meters. Defaults to params.contact_tolerance.
+        cache (str, optional): directory of the cached tables, None for params.cache as set when called, or False
+            to disable the cache. Defaults to None.
+
+    Returns:
+        np.ndarray: tables of shape (2, 2, n, n), see build
+    """
+    if cache is None:
+        cache = params.cache
+    if not cache:
+        return build(tolerance)
+    key = "_".join(f"{a}x{b}" for a, b in SHAPES)
+    filename = os.path.join(cache, f"contact_{key}_tol{tolerance}.npy")
+    if not os.path.exists(filename):
+        table = build(tolerance)
+        os.makedirs(cache, exist_ok=True)
+        # Write then rename, so that concurrent workers never read a partial file
+        temporary = f"{filename[:-4]}.{os.getpid()}.npy"
+        np.save(temporary, table)
+        os.replace(temporary, filename)
+    return np.load(filename, mmap_mode="r")
+
+
+def build(tolerance: float) -> np.ndarray:
+    """Tabulate the contact distance of every pair of shapes within an error bound.
+
+    The distance of closest approach only depends on the heading of the second ellipse and on
+    the bearing of its center, both relative to the heading of the first ellipse, and both with
+    a period of pi (ellipses are centrally symmetric). The resolution is doubled until the
+    bilinear interpolation at the centers of the cells, where its error peaks, is within the
+    tolerance of the exact routine for every pair.
+
+    Args:
+        tolerance (float): bound of the interpolation error in meters
+
+    Returns:
+        np.ndarray: contact distances of shape (2, 2, n, n), indexed by the kinds of the first and
+        second ellipses, the relative heading and the relative bearing (steps of pi / n)
+    """
+    n = 16
+    while True:
+        table = np.empty((2, 2, n, n))
+        nodes = np.arange(n) * pi / n
+        centers = nodes + pi / (2 * n)
+        worst = 0.0
+        for k1, (a1, b1) in enumerate(SHAPES):
+            for k2, (a2, b2) in enumerate(SHAPES):
+                table[k1, k2] = tabulate(a1, b1, a2, b2, nodes, nodes)
+                exact = tabulate(a1, b1, a2, b2, centers, centers)
+                phi, psi = np.meshgrid(centers, centers, indexing="ij")
+                approx = interpolate_many(table[k1, k2], phi.ravel(), psi.ravel()).reshape(n, n)
+                worst = max(worst, np.abs(approx - exact).max())
+        if worst <= tolerance:
+            return table
+        n *= 2
+
+
+def tabulate(a1: float, b1: float, a2: float, b2: float, phi: np.ndarray, psi: np.ndarray) -> np.ndarray:
+    """Exact contact distances on a grid of relative headings and bearings.
+
+    Args:
+        a1 (float): length of major semiaxis of first ellipse
+        b1 (float): length of minor semiaxis of first ellipse
+        a2 (float): length of major semiaxis of second ellipse
+        b2 (float): length of minor semiaxis of second ellipse
+        phi (np.ndarray): relative headings of the second ellipse
+        psi (np.ndarray): relative bearings of the center of the second ellipse
+
+    Returns:
+        np.ndarray: contact distances of shape (len(phi), len(psi))
+    """
+    shape = (len(phi), len(psi))
+    phi, psi = np.meshgrid(phi, psi, indexing="ij")
+    phi, psi = phi.ravel(), psi.ravel()
+    m = len(phi)
+    dist = ellipses_many(
+        np.full(m, a1),
+        np.full(m, b1),
+        np.full(m, a2),
+        np.full(m, b2),
+        np.zeros(m),
+        np.zeros(m),
+        np.cos(psi),
+        np.sin(psi),
+        np.zeros(m),
+        phi,
+        np.empty(m),
+    )
+    return dist.reshape(shape)
+
+
+@jit(nopython=True)
+def interpolate(table: np.ndarray, phi: float, psi: float) -> tuple:
+    """
+    Bilinear interpolation of a periodic table of contact distances.
+
+    Args:
+        table (ndarray): contact distances of one pair of shapes, see build
+        phi (float): relative heading of the second ellipse
+        psi (float): relative bearing of the center of the second ellipse
+
+    Returns:
+        tuple: the contact distance and its derivative with respect to the bearing
+    """
+    n = table.shape[0]
+    h = pi / n
+    u = (phi % pi) / h
+    v = (psi % pi) / h
+    i = min(int(floor(u)), n - 1)
+    j = min(int(floor(v)), n - 1)
+    u -= i
+    v -= j
+    i1 = (i + 1) % n
+    j1 = (j + 1) % n
+    dist = (1 - u) * ((1 - v) * table[i, j] + v * table[i, j1]) + u * ((1 - v) * table[i1, j] + v * table[i1, j1])
+    ddist = ((1 - u) * (table[i, j1] - table[i, j]) + u * (table[i1, j1] - table[i1, j])) / h
+    return dist, ddist
+
+
+@jit(nopython=True)
+def interpolate_many(table: np.ndarray, phi: np.ndarray, psi: np.ndarray) -> np.ndarray:
+    """
+    Bilinear interpolation of a periodic table of contact distances at many points.
+
+    Args:
+        table (ndarray): contact distances of one pair of shapes, see build
+        phi (ndarray): relative headings of the second ellipses
+        psi (ndarray): relative bearings of the centers of the second ellipses
+
+    Returns:
+        ndarray: the contact distances
+    """
+    out = np.empty(len(phi))
+    for k in range(len(phi)):
+        out[k], _ = interpolate(table, phi[k], psi[k])
+    return out
+
+
+@jit(nopython=True)
+def kind(a: float) -> int:
+    """
+    Kind of a vehicle from its major semiaxis.
+
+    Args:
+        a (float): length of major semiaxis
+
+    Returns:
+        int: 1 for motorcycles and 0 for cars
+    """
+    return 1 if a == params.moto_l else 0
+
+
+@jit(nopython=True)
+def ellipses_lookup(
+    table: np.ndarray,
+    a1: float,
+    a2: float,
+    x1: float,
+    y1: float,
+    x2: float,
+    y2: float,
+    theta1: float,
+    theta2: float,
+) -> tuple:
+    """
+    Tabulated counterpart of ellipses_derivative for the shapes of the vehicles.
+
+    Args:
+        table (ndarray): contact distances of shape (2, 2, n, n), see build
+        a1 (float): length of major semiaxis of first ellipse (to tell its kind)
+        a2 (float): length of major semiaxis of second ellipse (to tell its kind)
+        x1 (float): x coordinate of the center of the first ellipse
+        y1 (float): y coordinate of the center of the first ellipse
+        x2 (float): x coordinate of the center of the second ellipse
+        y2 (float): y coordinate of the center of the second ellipse
+        theta1 (float): angle associated with the major axis of first ellipse
+        theta2 (float): angle associated with the major axis of second ellipse
+
+    Returns:
+        tuple: distance between the centers when two ellipses are externally tangent and its
+        derivative with respect to the angle of the line joining the centers
+    """
+    theta3 = atan2(y2 - y1, x2 - x1)
+    return interpolate(table[kind(a1), kind(a2)], theta2 - theta1, theta3 - theta1)
@@ -1,3 +1,8 @@
-from .collision import collisions, newton_iteration  # noqa F401
-from .navigation import decay, navigate  # noqa F401
+from .cells import CellList  # noqa F401
+from .collision import collisions, contact, earliest, newton_iteration, solve, solve_many  # noqa F401
+from .geometry import Geometry  # noqa F401
+from .navigation import anticipate, choice_set, choice_width, decay, navigate, navigate_many, optimum  # noqa F401
+from .navigation import roots  # noqa F401
 from .particle import Particle  # noqa F401
+from .pool import SharedPool  # noqa F401
+from .swarm import Swarm  # noqa F401
@@ -0,0 +1,191 @@
+from math import floor
+
+import numpy as np
+from numba import jit
+
+from pNeuma_simulator.utils import periodic_shift
+
+
+class CellList:
+    """A periodic cell list of the agents along the road.
+
+    The ring [-L/2, L/2) is cut into buckets of equal width, at least as wide as requested.
+    Each bucket holds a doubly linked list of the agents whose center lies in it, so that an
+    update only relinks the agents that crossed a boundary since the previous step, and the
+    candidates of an ego are gathered from the few buckets overlapping its window instead of
+    from the whole road.
+
+    Attributes:
+        L (float): Road length in meters.
+        n_cells (int): Number of buckets.
+        width (float): Width of the buckets in meters.
+        cell (numpy.ndarray): Bucket of each agent.
+        head (numpy.ndarray): First agent of each bucket (-1 if empty).
+        successor (numpy.ndarray): Next agent in the same bucket (-1 if last).
+        predecessor (numpy.ndarray): Previous agent in the same bucket (-1 if first).
+    """
+
+    def __init__(self, x: np.ndarray, L: float, size: float):
+        """Bucket the agents.
+
+        Args:
+            x (numpy.ndarray): The x-coordinates of the agents.
+            L (float): Road length in meters.
+            size (float): Minimum width of the buckets in meters.
+        """
+        self.L = L
+        self.n_cells = max(int(L // size), 1)
+        self.width = L / self.n_cells
+        n = len(x)
+        self.cell = np.full(n, -1, dtype=np.int64)
+        self.head = np.full(self.n_cells, -1, dtype=np.int64)
+        self.successor = np.full(n, -1, dtype=np.int64)
+        self.predecessor = np.full(n, -1, dtype=np.int64)
+        self.update(x)
+
+    def update(self, x: np.ndarray) -> int:
+        """Relink the agents that changed bucket.
+
+        Args:
+            x (numpy.ndarray): The x-coordinates of the agents.
+
+        Returns:
+            int: The number of agents that changed bucket.
+        """
+        return relink(x, self.L, self.width, self.n_cells, self.cell, self.head, self.successor, self.predecessor)
+
+    def window(self, n: int, x: np.ndarray, lengths: np.ndarray, behind: float, ahead: float) -> np.ndarray:
+        """Agents overlapping a window along the road around an ego vehicle.
+
+        Args:
+            n (int): Positional index of the ego vehicle.
+            x (numpy.ndarray): The x-coordinates of the agents.
+            lengths (numpy.ndarray): The half lengths of the agents (bounds of their extent along x).
+            behind (float): Length of the window behind the ego in meters.
+            ahead (float): Length of the window ahead of the ego in meters.
+
+        Returns:
+            numpy.ndarray: The sorted positional indices of the agents, without the ego.
+        """
+        return window(n, x, lengths, behind, ahead, self.L, self.width, self.n_cells, self.head, self.successor)
+
+
+@jit(nopython=True)
+def locate(x: float, L: float, width: float, n_cells: int) -> int:
+    """
+    Bucket of a point of the ring.
+
+    Args:
+        x (float): The x-coordinate.
+        L (float): Road length in meters.
+        width (float): Width of the buckets in meters.
+        n_cells (int): Number of buckets.
+
+    Returns:
+        int: The index of the bucket.
+    """
+    return int(floor((x + L / 2) / width)) % n_cells
+
+
+@jit(nopython=True)
+def relink(
+    x: np.ndarray,
+    L: float,
+    width: float,
+    n_cells: int,
+    cell: np.ndarray,
+    head: np.ndarray,
+    successor: np.ndarray,
+    predecessor: np.ndarray,
+) -> int:
+    """
+    Move the agents that crossed a boundary to the list of their new bucket, in place.
+
+    Args:
+        x (ndarray): The x-coordinates of the agents.
+        L (float): Road length in meters.
+        width (float): Width of the buckets in meters.
+        n_cells (int): Number of buckets.
+        cell (ndarray): Bucket of each agent (-1 if not linked yet).
+        head (ndarray): First agent of each bucket.
+        successor (ndarray): Next agent in the same bucket.
+        predecessor (ndarray): Previous agent in the same bucket.
+
+    Returns:
+        int: The number of agents that changed bucket.
+    """
+    moved = 0
+    for n in range(len(x)):
+        c = locate(x[n], L, width, n_cells)
+        if c == cell[n]:
+            continue
+        if cell[n] >= 0:
+            # Unlink from the previous bucket
+            if predecessor[n] >= 0:
+                successor[predecessor[n]] = successor[n]
+            else:
+                head[cell[n]] = successor[n]
+            if successor[n] >= 0:
+                predecessor[successor[n]] = predecessor[n]
+        # Push to the front of the new bucket
+        predecessor[n] = -1
+        successor[n] = head[c]
+        if head[c] >= 0:
+            predecessor[head[c]] = n
+        head[c] = n
+        cell[n] = c
+        moved += 1
+    return moved
+
+
+@jit(nopython=True)
+def window(
+    n: int,
+    x: np.ndarray,
+    lengths: np.ndarray,
+    behind: float,
+    ahead: float,
+    L: float,
+    width: float,
+    n_cells: int,
+    head: np.ndarray,
+    successor: np.ndarray,
+) -> np.ndarray:
+    """
+    Compiled counterpart of CellList.window.
+
+    Args:
+        n (int): Positional index of the ego vehicle.
+        x (ndarray): The x-coordinates of the agents.
+        lengths (ndarray): The half lengths of the agents.
+        behind (float): Length of the window behind the ego in meters.
+        ahead (float): Length of the window ahead of the ego in meters.
+        L (float): Road length in meters.
+        width (float): Width of the buckets in meters.
+        n_cells (int): Number of buckets.
+        head (ndarray): First agent of each bucket.
+        successor (ndarray): Next agent in the same bucket.
+
+    Returns:
+        ndarray: The sorted positional indices of the agents, without the ego.
+    """
+    reach = lengths.max()
+    first = int(floor((x[n] - behind - reach + L / 2) / width))
+    last = int(floor((x[n] + ahead + reach + L / 2) / width))
+    # Every bucket at most once
+    last = min(last, first + n_cells - 1)
+    found = np.empty(len(x), dtype=np.int64)
+    k = 0
+    for c in range(first, last + 1):
+        j = head[c % n_cells]
+        while j >= 0:
+            if j != n:
+                dx = x[j] + periodic_shift(x[n], x[j], L) - x[n]
+                # The window may be longer than half the ring
+                for image in (dx - L, dx, dx + L):
+                    if image + lengths[j] > -behind and image - lengths[j] < ahead:
+                        found[k] = j
+                        k += 1
+                        break
+            j = successor[j]
+    return np.sort(found[:k])
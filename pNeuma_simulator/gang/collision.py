@@ -1,9 +1,10 @@
-from math import cos, radians, sin
+from math import cos, isnan, nan, radians, sin, sqrt
 
-from numba import jit
+import numpy as np
+from numba import jit, prange
 
 from pNeuma_simulator import params
-from pNeuma_simulator.contact_distance import calc_dtc
+from pNeuma_simulator.contact_distance import EXACT, calc_dtc, ellipses_derivative, ellipses_lookup
 from pNeuma_simulator.gang.particle import Particle
 from pNeuma_simulator.utils import tangent_dist
 
@@ -20,59 +21,514 @@ def collisions(ego: Particle, speed: float, theta: float, neighbors: list[Partic
     Returns:
         float: time to collision (or None if not defined).
     """
-    l_ttc = []
-    # initialize i
-    l_i, w_i = ego.l, ego.w
-    v_i = speed
-    theta_i = theta
-    vx_i, vy_i = v_i * cos(theta_i), v_i * sin(theta_i)
-    x_i, y_i = ego.x, ego.y
-    # analytically compute wall collision time
-    # possible dvision by zero
-    if vy_i != 0:
-        k_w = tangent_dist(theta_i, 0, l_i, w_i)
-        if theta_i >= radians(0.5):
-            ttc_w = (params.lane - (y_i + k_w)) / vy_i
-        elif theta_i <= -radians(0.5):
-            ttc_w = (-params.lane - (y_i - k_w)) / vy_i
-        else:
-            ttc_w = None
-    else:
-        ttc_w = None
-    if ttc_w is not None:
-        l_ttc.append(ttc_w)
+    agents = [ego] + neighbors
+    ttc = earliest(
+        0,
+        speed,
+        theta,
+        np.array([agent.x for agent in agents], dtype=float),
+        np.array([agent.y for agent in agents], dtype=float),
+        np.array([agent.vx for agent in agents], dtype=float),
+        np.array([agent.vy for agent in agents], dtype=float),
+        np.array([agent.theta for agent in agents], dtype=float),
+        np.array([agent.l for agent in agents], dtype=float),
+        np.array([agent.w for agent in agents], dtype=float),
+        np.arange(1, len(agents)),
+        np.zeros(len(neighbors)),
+        EXACT,
+    )
+    if isnan(ttc):
+        return None
+    return ttc
+
+
+@jit(nopython=True, cache=True)
+def earliest(
+    n: int,
+    speed: float,
+    theta: float,
+    x: np.ndarray,
+    y: np.ndarray,
+    vx: np.ndarray,
+    vy: np.ndarray,
+    thetas: np.ndarray,
+    lengths: np.ndarray,
+    widths: np.ndarray,
+    indices: np.ndarray,
+    shifts: np.ndarray,
+    table: np.ndarray,
+) -> float:
+    """
+    Compiled counterpart of collisions on the arrays of the agents.
+
+    Args:
+        n (int): Positional index of the ego vehicle.
+        speed (float): Check for collision at this speed.
+        theta (float): Check for collision in this direction.
+        x (ndarray): The x-coordinates of the agents.
+        y (ndarray): The y-coordinates of the agents.
+        vx (ndarray): The x-components of the velocities of the agents.
+        vy (ndarray): The y-components of the velocities of the agents.
+        thetas (ndarray): The angles of the agents.
+        lengths (ndarray): The half lengths of the agents.
+        widths (ndarray): The half widths of the agents.
+        indices (ndarray): Positional indices of the neighbors.
+        shifts (ndarray): Offsets along x of the neighbors (nearest periodic images).
+        table (ndarray): Tabulated contact distances (see contact_table), or EXACT.
+
+    Returns:
+        float: Time to collision (NaN if not defined).
+    """
+    l_i, w_i = lengths[n], widths[n]
+    vx_i, vy_i = speed * cos(theta), speed * sin(theta)
+    ttc_min = wall(y[n], speed, theta, l_i, w_i)
     # numerically compute anticipated collision time
-    for neighbor in neighbors:
-        # initialize j
-        l_j, w_j = neighbor.l, neighbor.w
-        theta_j = neighbor.theta
-        x_j, y_j = neighbor.x, neighbor.y
-        vx_j, vy_j = neighbor.vx, neighbor.vy
-        ttc, _ = newton_iteration(
-            l_j,
-            w_j,
+    for k in range(len(indices)):
+        j = indices[k]
+        if separated(x[j] + shifts[k], y[j], x[n], y[n], vx[j], vy[j], vx_i, vy_i, lengths[j] + l_i, np.inf):
+            continue
+        ttc, _, _ = solve(
+            lengths[j],
+            widths[j],
             l_i,
             w_i,
-            x_j,
-            y_j,
-            x_i,
-            y_i,
-            theta_j,
-            theta_i,
-            vx_j,
-            vy_j,
+            x[j] + shifts[k],
+            y[j],
+            x[n],
+            y[n],
+            thetas[j],
+            theta,
+            vx[j],
+            vy[j],
             vx_i,
             vy_i,
+            table,
         )
-        if ttc:
-            l_ttc.append(ttc)
-    if len(l_ttc) > 0:
-        return min(l_ttc)
-    else:
-        return None
+        ttc_min = earlier(ttc_min, ttc)
+    return ttc_min
+
+
+@jit(nopython=True, cache=True)
+def separated(
+    x_j: float,
+    y_j: float,
+    x_i: float,
+    y_i: float,
+    vx_j: float,
+    vy_j: float,
+    vx_i: float,
+    vy_i: float,
+    radius: float,
+    horizon: float,
+) -> bool:
+    """
+    Conservative broad phase of the time to collision, on bounding circles.
+
+    Each ellipse lies in the circle of radius its major semiaxis, so the ellipses cannot touch
+    before the circles do. The time at which the circles meet has a closed form in the relative
+    motion, and the pair is rejected if the circles are apart and separating, miss each other
+    or only meet after the horizon. Overlapping circles are never rejected.
+
+    Args:
+        x_j (float): x-coordinate of object j.
+        y_j (float): y-coordinate of object j.
+        x_i (float): x-coordinate of object i.
+        y_i (float): y-coordinate of object i.
+        vx_j (float): x-component of velocity of object j.
+        vy_j (float): y-component of velocity of object j.
+        vx_i (float): x-component of velocity of object i.
+        vy_i (float): y-component of velocity of object i.
+        radius (float): Sum of the radii of the bounding circles.
+        horizon (float): Times to collision beyond this horizon are not needed (inf if all are).
+
+    Returns:
+        bool: True if the objects cannot collide before the horizon.
+    """
+    rx, ry = x_i - x_j, y_i - y_j
+    rvx, rvy = vx_i - vx_j, vy_i - vy_j
+    c = rx**2 + ry**2 - radius**2
+    if c <= 0:
+        return False
+    b = rx * rvx + ry * rvy
+    if b >= 0:
+        return True  # Separating (or at rest)
+    a = rvx**2 + rvy**2
+    discriminant = b**2 - a * c
+    if discriminant < 0:
+        return True  # Missing
+    return (-b - sqrt(discriminant)) / a > horizon
+
+
+@jit(nopython=True, cache=True)
+def earlier(ttc_min: float, ttc: float) -> float:
+    """
+    Keep the earliest of two times to collision, a time to collision of zero being discarded as in collisions.
+
+    Args:
+        ttc_min (float): Earliest time to collision so far (NaN if not defined).
+        ttc (float): Candidate time to collision (NaN if not defined).
+
+    Returns:
+        float: The earliest time to collision (NaN if not defined).
+    """
+    if not isnan(ttc) and ttc != 0 and (isnan(ttc_min) or ttc < ttc_min):
+        return ttc
+    return ttc_min
+
+
+@jit(nopython=True, cache=True)
+def wall(y_i: float, speed: float, theta: float, l_i: float, w_i: float) -> float:
+    """
+    Analytically compute the time to collision with the walls, as in collisions.
+
+    Args:
+        y_i (float): y-coordinate of the ego vehicle.
+        speed (float): Check for collision at this speed.
+        theta (float): Check for collision in this direction.
+        l_i (float): Half length of the ego vehicle.
+        w_i (float): Half width of the ego vehicle.
+
+    Returns:
+        float: Time to collision with the walls (NaN if not defined).
+    """
+    vy_i = speed * sin(theta)
+    if vy_i != 0:
+        k_w = tangent_dist(theta, 0, l_i, w_i)
+        if theta >= radians(0.5):
+            return (params.lane - (y_i + k_w)) / vy_i
+        elif theta <= -radians(0.5):
+            return (-params.lane - (y_i - k_w)) / vy_i
+    return nan
+
+
+@jit(nopython=True, cache=True)
+def contact(
+    table: np.ndarray,
+    l_j: float,
+    w_j: float,
+    l_i: float,
+    w_i: float,
+    x_j: float,
+    y_j: float,
+    x_i: float,
+    y_i: float,
+    theta_j: float,
+    theta_i: float,
+) -> tuple:
+    """
+    Contact distance of two ellipses and its derivative, exact or tabulated.
+
+    Args:
+        table (ndarray): Tabulated contact distances (see contact_table), or EXACT.
+        l_j (float): Length of object j.
+        w_j (float): Width of object j.
+        l_i (float): Length of object i.
+        w_i (float): Width of object i.
+        x_j (float): x-coordinate of object j.
+        y_j (float): y-coordinate of object j.
+        x_i (float): x-coordinate of object i.
+        y_i (float): y-coordinate of object i.
+        theta_j (float): Orientation angle of object j.
+        theta_i (float): Orientation angle of object i.
+
+    Returns:
+        tuple: The distance between the centers when the ellipses are externally tangent and its
+        derivative with respect to the angle of the line joining the centers.
+    """
+    if table.size:
+        return ellipses_lookup(table, l_j, l_i, x_j, y_j, x_i, y_i, theta_j, theta_i)
+    return ellipses_derivative(l_j, w_j, l_i, w_i, x_j, y_j, x_i, y_i, theta_j, theta_i)
+
+
+@jit(nopython=True, cache=True)
+def distance(
+    l_j: float,
+    w_j: float,
+    l_i: float,
+    w_i: float,
+    x_j: float,
+    y_j: float,
+    x_i: float,
+    y_i: float,
+    theta_j: float,
+    theta_i: float,
+    vx_j: float,
+    vy_j: float,
+    vx_i: float,
+    vy_i: float,
+    t: float,
+    table: np.ndarray,
+    min_d: float = nan,
+    dmin_d: float = nan,
+) -> tuple:
+    """
+    Distance to closest approach of two objects at time t and its time derivative.
+
+    The derivative is exact: the distance between the centers and the angle of the line joining
+    them are differentiated analytically, and the contact distance through ellipses_derivative
+    (or through the interpolation of its table, which is piecewise linear in the angle).
+
+    Args:
+        l_j (float): Length of object j.
+        w_j (float): Width of object j.
+        l_i (float): Length of object i.
+        w_i (float): Width of object i.
+        x_j (float): x-coordinate of object j.
+        y_j (float): y-coordinate of object j.
+        x_i (float): x-coordinate of object i.
+        y_i (float): y-coordinate of object i.
+        theta_j (float): Orientation angle of object j.
+        theta_i (float): Orientation angle of object i.
+        vx_j (float): x-component of velocity of object j.
+        vy_j (float): y-component of velocity of object j.
+        vx_i (float): x-component of velocity of object i.
+        vy_i (float): y-component of velocity of object i.
+        t (float): Time in seconds.
+        table (ndarray): Tabulated contact distances (see contact_table), or EXACT.
+        min_d (float, optional): Contact distance at time t if already known (see Geometry), or NaN.
+            Default is NaN.
+        dmin_d (float, optional): Its derivative with respect to the angle of the line joining the
+            centers. Default is NaN.
+
+    Returns:
+        tuple: The distance to closest approach and its derivative.
+    """
+    x_j0, y_j0 = x_j + vx_j * t, y_j + vy_j * t
+    x_i0, y_i0 = x_i + vx_i * t, y_i + vy_i * t
+    rx, ry = x_i0 - x_j0, y_i0 - y_j0
+    rvx, rvy = vx_i - vx_j, vy_i - vy_j
+    s_i_j = sqrt(rx**2 + ry**2)
+    if isnan(min_d):
+        min_d, dmin_d = contact(table, l_j, w_j, l_i, w_i, x_j0, y_j0, x_i0, y_i0, theta_j, theta_i)
+    ds = (rx * rvx + ry * rvy) / s_i_j
+    dtheta3 = (rx * rvy - ry * rvx) / s_i_j**2
+    return s_i_j - min_d, ds - dmin_d * dtheta3
+
+
+@jit(nopython=True, cache=True)
+def solve(
+    l_j: float,
+    w_j: float,
+    l_i: float,
+    w_i: float,
+    x_j: float,
+    y_j: float,
+    x_i: float,
+    y_i: float,
+    theta_j: float,
+    theta_i: float,
+    vx_j: float,
+    vy_j: float,
+    vx_i: float,
+    vy_i: float,
+    table: np.ndarray,
+    max_iterations: int = 50,
+    tolerance: float = 1e-3,
+    seed: float = nan,
+    contact0: float = nan,
+    dcontact0: float = nan,
+) -> tuple:
+    """
+    Safeguarded Newton iteration for the time-to-collision (TTC) between two objects.
+
+    Newton's method is started at t = 0 with the exact derivative of the distance to closest
+    approach. Once a step overshoots the contact, the root is bracketed and the steps leaving
+    the bracket are replaced by bisection. As in newton_iteration, the search is abandoned if
+    the objects diverge before a contact is bracketed, a time of zero is returned at equilibrium
+    and overlapping objects get the (negative) time of their last contact.
+
+    A positive seed (e.g. the root of the previous time step, minus the time step) warm-starts
+    the iteration: if the objects are apart at t = 0 and at the seed, and approaching at the
+    seed, Newton's method starts there, on the assumption that they do not touch in between.
+    Otherwise, e.g. if the headings changed and the contact moved before the seed, the
+    iteration starts cold.
+
+    Args:
+        l_j (float): Length of object j.
+        w_j (float): Width of object j.
+        l_i (float): Length of object i.
+        w_i (float): Width of object i.
+        x_j (float): x-coordinate of object j.
+        y_j (float): y-coordinate of object j.
+        x_i (float): x-coordinate of object i.
+        y_i (float): y-coordinate of object i.
+        theta_j (float): Orientation angle of object j.
+        theta_i (float): Orientation angle of object i.
+        vx_j (float): x-component of velocity of object j.
+        vy_j (float): y-component of velocity of object j.
+        vx_i (float): x-component of velocity of object i.
+        vy_i (float): y-component of velocity of object i.
+        table (ndarray): Tabulated contact distances (see contact_table), or EXACT.
+        max_iterations (int, optional): Maximum number of iterations. Default is 50.
+        tolerance (float, optional): Desired tolerance in seconds. Default is 0.001.
+        seed (float, optional): Warm start in seconds, or NaN to start at zero. Default is NaN.
+        contact0 (float, optional): Contact distance at t = 0 if already known (see Geometry), or NaN.
+            Default is NaN.
+        dcontact0 (float, optional): Its derivative with respect to the angle of the line joining the
+            centers. Default is NaN.
+
+    Returns:
+        tuple: A tuple containing:
+            - float: Time-to-collision value, or NaN if no solution is found.
+            - int: Number of iterations performed.
+            - bool: False if the maximum number of iterations was reached.
+    """
+    d0, dprime = distance(
+        l_j,
+        w_j,
+        l_i,
+        w_i,
+        x_j,
+        y_j,
+        x_i,
+        y_i,
+        theta_j,
+        theta_i,
+        vx_j,
+        vy_j,
+        vx_i,
+        vy_i,
+        0.0,
+        table,
+        contact0,
+        dcontact0,
+    )
+    if d0 == 0 or dprime == 0:
+        return (0.0, 0, True)  # Equilibrium solution
+    t0 = 0.0
+    first = 1
+    if seed > 0 and d0 > 0:
+        # Warm start, assuming that the objects do not touch before the seed
+        first = 2  # The evaluation at the seed counts as an iteration
+        d_seed, dprime_seed = distance(
+            l_j, w_j, l_i, w_i, x_j, y_j, x_i, y_i, theta_j, theta_i, vx_j, vy_j, vx_i, vy_i, seed, table
+        )
+        if d_seed > 0 and dprime_seed < 0:
+            t0, d0, dprime = seed, d_seed, dprime_seed
+    lo, hi = (t0, np.inf) if d0 > 0 else (-np.inf, 0.0)
+    for iterations in range(first, max_iterations + 1):
+        t1 = t0 - d0 / dprime if dprime < 0 else np.nan
+        # A step that lands on the root leaves it on a bound of the bracket
+        if lo <= t1 <= hi and abs(t1 - t0) <= tolerance:
+            return (t1, iterations, True)
+        if not lo < t1 < hi:
+            if np.isinf(lo) or np.isinf(hi):
+                return (np.nan, iterations, True)  # Give up if agents are diverging
+            t1 = 0.5 * (lo + hi)  # Bisect within the bracket
+        if abs(t1 - t0) <= tolerance:
+            return (t1, iterations, True)
+        t0 = t1
+        d0, dprime = distance(
+            l_j, w_j, l_i, w_i, x_j, y_j, x_i, y_i, theta_j, theta_i, vx_j, vy_j, vx_i, vy_i, t0, table
+        )
+        if d0 > 0:
+            lo = t0
+        elif d0 < 0:
+            hi = t0
+        else:
+            return (t0, iterations, True)
+    return (np.nan, max_iterations, False)
+
+
+@jit(nopython=True, parallel=True, cache=True)
+def solve_many(
+    x: np.ndarray,
+    y: np.ndarray,
+    vx: np.ndarray,
+    vy: np.ndarray,
+    thetas: np.ndarray,
+    lengths: np.ndarray,
+    widths: np.ndarray,
+    egos: np.ndarray,
+    others: np.ndarray,
+    shifts: np.ndarray,
+    speeds: np.ndarray,
+    headings: np.ndarray,
+    horizons: np.ndarray,
+    seeds: np.ndarray,
+    pairs: np.ndarray,
+    contacts: np.ndarray,
+    dcontacts: np.ndarray,
+    table: np.ndarray,
+    max_iterations: int = 50,
+    tolerance: float = 1e-3,
+) -> tuple:
+    """
+    Solve the time to collision of a batch of (ego, neighbor, heading) triples in parallel.
+
+    The triples rejected by the broad phase (see separated) are not solved and get NaN, like
+    the diverging ones of solve. As a time of zero is discarded downstream (see earlier), this
+    only differs from solve for the times beyond the horizon of the triple.
+
+    Args:
+        x (ndarray): The x-coordinates of the agents.
+        y (ndarray): The y-coordinates of the agents.
+        vx (ndarray): The x-components of the velocities of the agents.
+        vy (ndarray): The y-components of the velocities of the agents.
+        thetas (ndarray): The angles of the agents.
+        lengths (ndarray): The half lengths of the agents.
+        widths (ndarray): The half widths of the agents.
+        egos (ndarray): Positional indices of the egos.
+        others (ndarray): Positional indices of the neighbors.
+        shifts (ndarray): Offsets along x of the neighbors (nearest periodic images).
+        speeds (ndarray): Speeds of the egos.
+        headings (ndarray): Headings of the egos.
+        horizons (ndarray): Times to collision beyond these horizons are not needed (inf if all are).
+        seeds (ndarray): Warm starts of the triples (NaN to start at zero, see solve).
+        pairs (ndarray): Unordered pairs of the triples at the current heading of the ego, or -1.
+        contacts (ndarray): Contact distances of the pairs at the current headings (see Geometry).
+        dcontacts (ndarray): Their derivatives with respect to the angle of the line joining the centers.
+        table (ndarray): Tabulated contact distances (see contact_table), or EXACT.
+        max_iterations (int, optional): Maximum number of iterations. Default is 50.
+        tolerance (float, optional): Desired tolerance in seconds. Default is 0.001.
+
+    Returns:
+        tuple: Times to collision (NaN if not defined), numbers of iterations, convergence flags
+        and flags of the triples rejected by the broad phase, one per triple.
+    """
+    n_triples = len(egos)
+    ttc = np.empty(n_triples)
+    iterations = np.empty(n_triples, dtype=np.int64)
+    converged = np.empty(n_triples, dtype=np.bool_)
+    culled = np.empty(n_triples, dtype=np.bool_)
+    for k in prange(n_triples):
+        i, j = egos[k], others[k]
+        vx_i, vy_i = speeds[k] * cos(headings[k]), speeds[k] * sin(headings[k])
+        # Newton may stop up to the tolerance before the contact
+        horizon = horizons[k] + tolerance
+        culled[k] = separated(
+            x[j] + shifts[k], y[j], x[i], y[i], vx[j], vy[j], vx_i, vy_i, lengths[j] + lengths[i], horizon
+        )
+        if culled[k]:
+            ttc[k], iterations[k], converged[k] = np.nan, 0, True
+            continue
+        contact0, dcontact0 = (contacts[pairs[k]], dcontacts[pairs[k]]) if pairs[k] >= 0 else (nan, nan)
+        ttc[k], iterations[k], converged[k] = solve(
+            lengths[j],
+            widths[j],
+            lengths[i],
+            widths[i],
+            x[j] + shifts[k],
+            y[j],
+            x[i],
+            y[i],
+            thetas[j],
+            headings[k],
+            vx[j],
+            vy[j],
+            vx_i,
+            vy_i,
+            table,
+            max_iterations,
+            tolerance,
+            seeds[k],
+            contact0,
+            dcontact0,
+        )
+    return ttc, iterations, converged, culled
 
 
-@jit(nopython=True)
+@jit(nopython=True, cache=True)
 def newton_iteration(
     l_j: float,
     w_j: float,
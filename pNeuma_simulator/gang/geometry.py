@@ -0,0 +1,144 @@
+from math import inf, nan
+
+import numpy as np
+from numba import jit, prange
+
+from pNeuma_simulator.gang.collision import contact, separated
+
+
+class Geometry:
+    """The symmetric geometry of the interacting pairs at the current step.
+
+    When i sees j and j sees i, both navigators and both leader searches evaluate the contact
+    distance of the same two ellipses at their current headings, which is the same quantity in
+    either order. It is computed once per unordered pair instead: eagerly for the pairs whose
+    time to collision is solved (see solve_many), and on demand by the leader search for the
+    others. The geometry is only valid until the agents move (see Swarm.advance).
+
+    Attributes:
+        pair (numpy.ndarray): Unordered pair of each entry of the interactions, aligned with indices.
+        contact (numpy.ndarray): Contact distance of each pair at the current headings (NaN if not
+            computed yet).
+        dcontact (numpy.ndarray): Derivative of the contact distance with respect to the angle of
+            the line joining the centers (the same in either order).
+    """
+
+    def __init__(
+        self,
+        swarm,
+        navigators: np.ndarray,
+        indptr: np.ndarray,
+        indices: np.ndarray,
+        shifts: np.ndarray,
+        table: np.ndarray,
+    ):
+        """Pair up the interactions and compute the contact distances needed by the navigation.
+
+        Args:
+            swarm (Swarm): The state of the agents.
+            navigators (numpy.ndarray): Positional indices of the agents with interactions.
+            indptr (numpy.ndarray): Offsets of the neighbors of each navigator.
+            indices (numpy.ndarray): Positional indices of the neighbors.
+            shifts (numpy.ndarray): Offsets along x of the neighbors.
+            table (numpy.ndarray): Tabulated contact distances (see contact_table), or EXACT.
+        """
+        self.pair, self.contact, self.dcontact = pairwise(
+            swarm.x,
+            swarm.y,
+            swarm.vx,
+            swarm.vy,
+            swarm.theta,
+            swarm.l,
+            swarm.w,
+            navigators,
+            indptr,
+            indices,
+            shifts,
+            table,
+        )
+
+    def __len__(self):
+        return len(self.contact)
+
+
+@jit(nopython=True, parallel=True)
+def pairwise(
+    x: np.ndarray,
+    y: np.ndarray,
+    vx: np.ndarray,
+    vy: np.ndarray,
+    theta: np.ndarray,
+    lengths: np.ndarray,
+    widths: np.ndarray,
+    navigators: np.ndarray,
+    indptr: np.ndarray,
+    indices: np.ndarray,
+    shifts: np.ndarray,
+    table: np.ndarray,
+) -> tuple:
+    """
+    Compiled counterpart of Geometry.
+
+    A pair is computed eagerly if the time to collision of either of its agents at its current
+    heading is solved, i.e. if the pair is not rejected by the broad phase (see separated).
+
+    Args:
+        x (ndarray): The x-coordinates of the agents.
+        y (ndarray): The y-coordinates of the agents.
+        vx (ndarray): The x-components of the velocities of the agents.
+        vy (ndarray): The y-components of the velocities of the agents.
+        theta (ndarray): The angles of the agents.
+        lengths (ndarray): The half lengths of the agents.
+        widths (ndarray): The half widths of the agents.
+        navigators (ndarray): Positional indices of the agents with interactions.
+        indptr (ndarray): Offsets of the neighbors of each navigator.
+        indices (ndarray): Positional indices of the neighbors.
+        shifts (ndarray): Offsets along x of the neighbors.
+        table (ndarray): Tabulated contact distances (see contact_table), or EXACT.
+
+    Returns:
+        tuple: The unordered pair of each entry of indices, and the contact distances and their
+        derivatives, one per pair (NaN if not needed by the navigation).
+    """
+    N = len(x)
+    slots = np.full((N, N), -1, dtype=np.int64)
+    pair = np.empty(len(indices), dtype=np.int64)
+    # One entry per pair, in the order of its first appearance
+    entries = np.empty(len(indices), dtype=np.int64)
+    egos = np.empty(len(indices), dtype=np.int64)
+    needed = np.zeros(len(indices), dtype=np.bool_)
+    n_pairs = 0
+    for m in range(len(navigators)):
+        i = navigators[m]
+        for p in range(indptr[m], indptr[m + 1]):
+            j = indices[p]
+            a, b = min(i, j), max(i, j)
+            if slots[a, b] < 0:
+                slots[a, b] = n_pairs
+                entries[n_pairs] = p
+                egos[n_pairs] = i
+                n_pairs += 1
+            pair[p] = slots[a, b]
+            radius = lengths[i] + lengths[j]
+            if not separated(x[j] + shifts[p], y[j], x[i], y[i], vx[j], vy[j], vx[i], vy[i], radius, inf):
+                needed[pair[p]] = True
+    contacts = np.full(n_pairs, nan)
+    dcontacts = np.full(n_pairs, nan)
+    for q in prange(n_pairs):
+        if needed[q]:
+            p, i = entries[q], egos[q]
+            j = indices[p]
+            contacts[q], dcontacts[q] = contact(
+                table,
+                lengths[j],
+                widths[j],
+                lengths[i],
+                widths[i],
+                x[j] + shifts[p],
+                y[j],
+                x[i],
+                y[i],
+                theta[j],
+                theta[i],
+            )
+    return pair, contacts, dcontacts
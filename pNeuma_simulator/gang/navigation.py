@@ -1,22 +1,28 @@
-from math import exp
+from math import exp, nan
 
 import numpy as np
-from numba import jit
-from numpy import argmin, argwhere, array
-from scipy.signal import find_peaks
+from numba import jit, prange, types
+from numba.typed import Dict
+from numpy import arange, array, full, isnan, zeros
 
 from pNeuma_simulator import params
-from pNeuma_simulator.gang import collisions
+from pNeuma_simulator.contact_distance import EXACT
+from pNeuma_simulator.gang.collision import earlier, solve_many, wall
 from pNeuma_simulator.gang.neighborhood import neighborhood
 from pNeuma_simulator.gang.particle import Particle
 
+# Widest choice set (at a speed of zero) in radians, the others are its centered slices
+N_GAMMA = round(exp(params.CM) / params.da)
+GAMMAS = np.radians(np.arange(N_GAMMA, -N_GAMMA - 1, -1) * params.da)
 
-def navigate(ego: Particle, agents: list[Particle]) -> tuple:
+
+def navigate(ego: Particle, agents: list[Particle], table: np.ndarray = EXACT) -> tuple:
     """Anticipatory operational navigation
 
     Args:
         ego (Particle): ego vehicle to be updated
         agents (list): list of agents in the simulation
+        table (np.ndarray, optional): tabulated contact distances (see contact_table). Defaults to EXACT.
 
     Returns:
         tuple: target direction in radians,
@@ -24,45 +30,275 @@ def navigate(ego: Particle, agents: list[Particle]) -> tuple:
         time to collision in seconds.
     """
     neighbors = neighborhood(ego, agents)
+    return anticipate(ego, neighbors, table)
+
+
+def anticipate(ego: Particle, neighbors: list[Particle], table: np.ndarray = EXACT) -> tuple:
+    """Anticipatory operational navigation among known neighbors
+
+    Args:
+        ego (Particle): ego vehicle to be updated
+        neighbors (list): neighboring vehicles, already mapped to their nearest periodic image
+        table (np.ndarray, optional): tabulated contact distances (see contact_table). Defaults to EXACT.
+
+    Returns:
+        tuple: target direction in radians,
+        corresponding distance to collision in meters and
+        time to collision in seconds.
+    """
+    agents = [ego] + neighbors
+    a0, f_a, ttc, _ = navigate_many(
+        array([agent.x for agent in agents], dtype=float),
+        array([agent.y for agent in agents], dtype=float),
+        array([agent.vx for agent in agents], dtype=float),
+        array([agent.vy for agent in agents], dtype=float),
+        array([agent.theta for agent in agents], dtype=float),
+        array([agent.speed for agent in agents], dtype=float),
+        array([agent.l for agent in agents], dtype=float),
+        array([agent.w for agent in agents], dtype=float),
+        array([ego.v0] + [nan] * len(neighbors), dtype=float),
+        array([agent.mode == "Moto" for agent in agents]),
+        array([0]),
+        array([0, len(neighbors)]),
+        arange(1, len(agents)),
+        zeros(len(neighbors)),
+        full(len(neighbors), -1),
+        zeros(0),
+        zeros(0),
+        table,
+        roots(),
+    )
     if ego.mode == "Moto":
-        # exponential decay of deviations
-        alphas = decay(ego.speed, ego.theta)
-        # compute distance to collision
-        f_a = []
-        v_0 = ego.v0
-        for alpha in alphas:
-            ttc = collisions(ego, v_0, alpha + ego.theta, neighbors)
-            if ttc:
-                f = ttc * v_0
-            else:
-                f = params.d_max
-            f_a.append(min([f, params.d_max]))
-        f_a = array(f_a)
-        # maximize distance to collision
-        try:
-            optima = find_peaks(f_a)[0]
-            peaks = array(f_a)[optima]
-            maxima = argwhere(peaks == max(peaks)).flatten()
-            indices = optima[maxima]
-            if len(indices) > 1:
-                # get the most central optimum (less deviation)
-                optimum = indices[argmin(abs(alphas[indices]))]
-            else:
-                optimum = indices[0]
-            # desired direction
-            a0 = alphas[optimum]
-        except ValueError:
-            a0 = 0
+        f_a = f_a[0][~isnan(f_a[0])]
     else:
-        a0 = 0
         f_a = None
-    # actual time to collision
-    ttc = collisions(ego, ego.speed, ego.theta, neighbors)
-    # store the result
-    return (a0, f_a, ttc)
+    return (a0[0], f_a, None if isnan(ttc[0]) else ttc[0])
+
+
+@jit(nopython=True, parallel=True, cache=True)
+def navigate_many(
+    x: np.ndarray,
+    y: np.ndarray,
+    vx: np.ndarray,
+    vy: np.ndarray,
+    theta: np.ndarray,
+    speed: np.ndarray,
+    lengths: np.ndarray,
+    widths: np.ndarray,
+    v0: np.ndarray,
+    moto: np.ndarray,
+    navigators: np.ndarray,
+    indptr: np.ndarray,
+    indices: np.ndarray,
+    shifts: np.ndarray,
+    pair: np.ndarray,
+    contacts: np.ndarray,
+    dcontacts: np.ndarray,
+    table: np.ndarray,
+    cache: Dict,
+) -> tuple:
+    """
+    Anticipatory operational navigation of several agents in one compiled call.
+
+    The neighbors of the m-th navigator are indices[indptr[m]:indptr[m + 1]], mapped to their
+    nearest periodic images by the offsets along x in shifts. The time to collision is solved in
+    one batch (see solve_many) for every neighbor and every candidate heading of the motorcycles
+    and current heading of the navigators. At the current headings, the solver starts from the
+    contact distances of the pairs if they are known (see Geometry).
+
+    Args:
+        x (ndarray): The x-coordinates of the agents.
+        y (ndarray): The y-coordinates of the agents.
+        vx (ndarray): The x-components of the velocities of the agents.
+        vy (ndarray): The y-components of the velocities of the agents.
+        theta (ndarray): The angles of the agents.
+        speed (ndarray): The speeds of the agents.
+        lengths (ndarray): The half lengths of the agents.
+        widths (ndarray): The half widths of the agents.
+        v0 (ndarray): The desired speeds of the agents.
+        moto (ndarray): Boolean mask of the motorcycles.
+        navigators (ndarray): Positional indices of the navigators.
+        indptr (ndarray): Offsets of the neighbors of each navigator.
+        indices (ndarray): Positional indices of the neighbors.
+        shifts (ndarray): Offsets along x of the neighbors.
+        pair (ndarray): Unordered pairs of the neighbors, aligned with indices (see Geometry), or -1.
+        contacts (ndarray): Contact distances of the pairs at the current headings (NaN if unknown).
+        dcontacts (ndarray): Their derivatives with respect to the angle of the line joining the centers.
+        table (ndarray): Tabulated contact distances (see contact_table), or EXACT.
+        cache (Dict): Roots of the previous step (see roots), updated in place.
+
+    Returns:
+        tuple: target directions in radians, distances to collision in meters for each candidate
+        direction (padded with NaN, motorcycles only) and times to collision in seconds (NaN if
+        not defined), one row per navigator, and the numbers of (ego, neighbor, heading) triples,
+        of narrow-phase solves saved by the broad phase and of Newton iterations.
+    """
+    n_nav = len(navigators)
+    # choice sets of the motorcycles
+    offsets = np.zeros(n_nav + 1, dtype=np.int64)
+    for m in range(n_nav):
+        n = navigators[m]
+        offsets[m + 1] = offsets[m]
+        if moto[n]:
+            offsets[m + 1] += 2 * half_width(speed[n]) + 1
+    n_alphas = offsets[n_nav]
+    alphas = np.empty(n_alphas)
+    owners = np.empty(n_alphas, dtype=np.int64)
+    # position of each heading in GAMMAS, past its end for the current headings
+    slots = np.full(n_alphas + n_nav, len(GAMMAS), dtype=np.int64)
+    for m in range(n_nav):
+        n = navigators[m]
+        if moto[n]:
+            gammas = choice_set(speed[n])
+            for p in range(len(gammas)):
+                alphas[offsets[m] + p] = gammas[p] - theta[n]
+                slots[offsets[m] + p] = N_GAMMA - half_width(speed[n]) + p
+            owners[offsets[m] : offsets[m + 1]] = m
+    # one task per candidate heading and one per navigator (actual time to collision)
+    n_tasks = n_alphas + n_nav
+    tasks = np.empty(n_tasks, dtype=np.int64)
+    speeds = np.empty(n_tasks)
+    headings = np.empty(n_tasks)
+    starts = np.zeros(n_tasks + 1, dtype=np.int64)
+    for k in range(n_tasks):
+        m = owners[k] if k < n_alphas else k - n_alphas
+        n = navigators[m]
+        tasks[k] = m
+        if k < n_alphas:
+            speeds[k], headings[k] = v0[n], alphas[k] + theta[n]
+        else:
+            speeds[k], headings[k] = speed[n], theta[n]
+        starts[k + 1] = starts[k] + indptr[m + 1] - indptr[m]
+    # one triple per task and neighbor
+    egos = np.empty(starts[n_tasks], dtype=np.int64)
+    others = np.empty(starts[n_tasks], dtype=np.int64)
+    offsets_x = np.empty(starts[n_tasks])
+    keys = np.empty(starts[n_tasks], dtype=np.int64)
+    seeds = np.empty(starts[n_tasks])
+    pairs = np.full(starts[n_tasks], -1, dtype=np.int64)
+    for k in range(n_tasks):
+        m = tasks[k]
+        for p in range(indptr[m + 1] - indptr[m]):
+            q = starts[k] + p
+            egos[q] = navigators[m]
+            others[q] = indices[indptr[m] + p]
+            offsets_x[q] = shifts[indptr[m] + p]
+            # warm start from the root of the same triple at the previous step
+            keys[q] = (egos[q] * len(x) + others[q]) * (len(GAMMAS) + 1) + slots[k]
+            seeds[q] = cache.get(keys[q], np.nan) - params.dt
+            # the geometry of the pair only holds at the current heading
+            if k >= n_alphas:
+                pairs[q] = pair[indptr[m] + p]
+    # distances to collision are capped at d_max for the candidate headings
+    horizons = np.full(n_tasks, np.inf)
+    for k in range(n_alphas):
+        if speeds[k] > 0:
+            horizons[k] = params.d_max / speeds[k]
+    triples, iterations, converged, culled = solve_many(
+        x,
+        y,
+        vx,
+        vy,
+        theta,
+        lengths,
+        widths,
+        egos,
+        others,
+        offsets_x,
+        np.repeat(speeds, starts[1:] - starts[:-1]),
+        np.repeat(headings, starts[1:] - starts[:-1]),
+        np.repeat(horizons, starts[1:] - starts[:-1]),
+        seeds,
+        pairs,
+        contacts,
+        dcontacts,
+        table,
+    )
+    # triples that left the interactions are evicted
+    cache.clear()
+    for q in range(len(triples)):
+        if triples[q] > 0 and converged[q]:
+            cache[keys[q]] = triples[q]
+    ttcs = np.empty(n_tasks)
+    for k in prange(n_tasks):
+        n = navigators[tasks[k]]
+        ttc_min = wall(y[n], speeds[k], headings[k], lengths[n], widths[n])
+        for p in range(starts[k], starts[k + 1]):
+            ttc_min = earlier(ttc_min, triples[p])
+        ttcs[k] = ttc_min
+    # maximize distance to collision
+    n_cols = 0
+    for m in range(n_nav):
+        n_cols = max(n_cols, offsets[m + 1] - offsets[m])
+    a0 = np.zeros(n_nav)
+    f_a = np.full((n_nav, n_cols), np.nan)
+    for m in range(n_nav):
+        n = navigators[m]
+        for k in range(offsets[m], offsets[m + 1]):
+            ttc = ttcs[k]
+            if np.isnan(ttc) or ttc == 0:
+                f = params.d_max
+            else:
+                f = ttc * v0[n]
+            f_a[m, k - offsets[m]] = min(f, params.d_max)
+        if offsets[m + 1] > offsets[m]:
+            a0[m] = optimum(f_a[m, : offsets[m + 1] - offsets[m]], alphas[offsets[m] : offsets[m + 1]])
+    counts = np.array([len(culled), culled.sum(), iterations.sum()])
+    return a0, f_a, ttcs[n_alphas:], counts
 
 
-@jit(nopython=True)
+def roots() -> Dict:
+    """
+    An empty cache of the roots of the time to collision, for navigate_many.
+
+    The roots are keyed by the positional indices of the ego and of the neighbor and by the
+    position of the heading in GAMMAS (past its end for the current heading).
+
+    Returns:
+        Dict: The typed dictionary of the roots in seconds.
+    """
+    return Dict.empty(key_type=types.int64, value_type=types.float64)
+
+
+@jit(nopython=True, cache=True)
+def optimum(f_a: np.ndarray, alphas: np.ndarray) -> float:
+    """
+    Select the most central of the highest peaks of the distance to collision.
+
+    The peaks are the local maxima of scipy.signal.find_peaks (the middle of flat peaks).
+
+    Args:
+        f_a (ndarray): Distances to collision.
+        alphas (ndarray): Candidate directions.
+
+    Returns:
+        float: The target direction, or 0 if there is no peak.
+    """
+    best = -1
+    i = 1
+    i_max = len(f_a) - 1
+    while i < i_max:
+        if f_a[i - 1] < f_a[i]:
+            i_ahead = i + 1
+            while i_ahead < i_max and f_a[i_ahead] == f_a[i]:
+                i_ahead += 1
+            if f_a[i_ahead] < f_a[i]:
+                peak = (i + i_ahead - 1) // 2
+                # strictly higher or as high and less deviation
+                if (
+                    best < 0
+                    or f_a[peak] > f_a[best]
+                    or (f_a[peak] == f_a[best] and abs(alphas[peak]) < abs(alphas[best]))
+                ):
+                    best = peak
+                i = i_ahead
+        i += 1
+    if best < 0:
+        return 0.0
+    return alphas[best]
+
+
+@jit(nopython=True, cache=True)
 def decay(speed: float, theta: float) -> np.ndarray:
     """
     Calculate the choice set for a given speed and angle.
@@ -74,9 +310,48 @@ def decay(speed: float, theta: float) -> np.ndarray:
     Returns:
         alphas (ndarray): An array of angles in radians.
     """
-    gamma_max = round(exp(params.XM * speed * params.factor + params.CM) / params.da) * params.da
-    # angular resolution in the reference system of the road
-    gamma = np.linspace(gamma_max, -gamma_max, int(2 * gamma_max / params.da) + 1)
     # in the reference system of the agent
-    alphas = np.radians(gamma) - theta
+    alphas = choice_set(speed) - theta
     return alphas
+
+
+@jit(nopython=True, cache=True)
+def half_width(speed: float) -> int:
+    """
+    Half width of the choice set in steps of the angular resolution.
+
+    Args:
+        speed (float): The speed value.
+
+    Returns:
+        int: The number of steps on each side of the heading of the road.
+    """
+    return round(exp(params.XM * speed * params.factor + params.CM) / params.da)
+
+
+@jit(nopython=True, cache=True)
+def choice_set(speed: float) -> np.ndarray:
+    """
+    Choice set for a given speed in the reference system of the road.
+
+    Args:
+        speed (float): The (nonnegative) speed value.
+
+    Returns:
+        gammas (ndarray): A read-only view of GAMMAS, from left to right in radians.
+    """
+    k = half_width(speed)
+    return GAMMAS[N_GAMMA - k : N_GAMMA + k + 1]
+
+
+def choice_width(speed: float | np.ndarray) -> float | np.ndarray:
+    """
+    Angular width of the choice set, in closed form.
+
+    Args:
+        speed (float | ndarray): The speed values.
+
+    Returns:
+        float | ndarray: The angle between the extreme choices in degrees.
+    """
+    return 2 * params.da * np.round(np.exp(params.XM * np.asarray(speed) * params.factor + params.CM) / params.da)
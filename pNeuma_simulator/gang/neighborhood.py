@@ -1,4 +1,5 @@
 from pNeuma_simulator.gang.particle import Particle
+from pNeuma_simulator.utils import periodic_shift
 
 
 def neighborhood(ego: Particle, candidates: list[Particle]) -> list[Particle]:
@@ -23,3 +24,26 @@ def neighborhood(ego: Particle, candidates: list[Particle]) -> list[Particle]:
         else:
             neighbors.append(other)
     return neighbors
+
+
+def indexed_neighborhood(ego: int, swarm, L: float) -> tuple[list[int], list[float]]:
+    """Constructs a neighborhood with periodic boundaries on a struct-of-arrays state.
+
+    Each neighbor is mapped to its periodic image nearest to the ego vehicle (minimum-image convention).
+
+    Args:
+        ego (int): positional index of the ego vehicle.
+        swarm (Swarm): state of all the vehicles.
+        L (float): road length.
+
+    Returns:
+        tuple: positional indices of the neighboring vehicles and the offsets of their nearest images.
+    """
+    indices = []
+    shifts = []
+    x = swarm.x
+    for interaction in swarm.interactions[ego]:
+        other = int(interaction - 1)
+        indices.append(other)
+        shifts.append(periodic_shift(x[ego], x[other], L))
+    return indices, shifts
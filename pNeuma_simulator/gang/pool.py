@@ -0,0 +1,241 @@
+import multiprocessing
+import queue
+import traceback
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+from numba import set_num_threads
+
+from pNeuma_simulator.contact_distance import EXACT, contact_table
+from pNeuma_simulator.gang.geometry import Geometry
+from pNeuma_simulator.gang.navigation import navigate_many, roots
+from pNeuma_simulator.gang.swarm import Swarm
+
+# Seconds between the checks that the workers are alive
+TIMEOUT = 10
+
+
+class SharedPool:
+    """A pool of workers persisting for a whole run, for the navigation stage.
+
+    The state of the swarm lives in shared memory: once shared, the arrays of the swarm are
+    the shared buffers themselves, so nothing is pickled on each step. The interactions are
+    passed as a compressed sparse row structure, workers only receive index ranges into the
+    list of navigators, and their results come back through shared output buffers. Each worker
+    always navigates the same agents, so that its cache of the roots of the previous step (see
+    roots) does not depend on the scheduling and the runs are reproducible.
+
+    The workers are spawned, and their kernels loaded, once per pool: it pays off for a single large
+    run, not for many short seeds, which are better spread over processes by the caller (see batch).
+    Each worker runs the kernels on one thread, the pool itself providing the parallelism.
+
+    Attributes:
+        n_workers (int): Number of worker processes.
+        arrays (dict): Shared arrays, keyed by name.
+        blocks (list): Shared memory blocks backing the arrays.
+        workers (list): Worker processes.
+    """
+
+    def __init__(self, n_workers: int):
+        """Initialize the pool, whose workers are started by share.
+
+        Args:
+            n_workers (int): Number of worker processes.
+        """
+        self.n_workers = n_workers
+        self.arrays = {}
+        self.blocks = []
+        self.workers = []
+        # Forking after the threading layer of numba has started is not safe
+        context = multiprocessing.get_context("spawn")
+        # One queue per worker, to pin the agents to the workers
+        self.tasks = [context.Queue() for _ in range(n_workers)]
+        self.results = context.Queue()
+        self.context = context
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def share(self, swarm: Swarm, contact: str = "exact") -> Swarm:
+        """Move the state of a swarm to shared memory and start the workers.
+
+        Args:
+            swarm (Swarm): The swarm to share.
+            contact (str, optional): Either "exact" or "table", in which case the workers memory-map
+                the cached table of contact distances (see contact_table). Defaults to "exact".
+
+        Returns:
+            Swarm: A swarm with the same state, backed by the shared buffers.
+        """
+        n = len(swarm)
+        specs = {name: (getattr(swarm, name).shape, getattr(swarm, name).dtype.str) for name in Swarm.fields}
+        # Interactions in compressed sparse row format and outputs
+        specs["indptr"] = ((n + 1,), np.dtype(np.int64).str)
+        specs["indices"] = ((n * n,), np.dtype(np.int64).str)
+        specs["shifts"] = ((n * n,), np.dtype(float).str)
+        specs["navigators"] = ((n,), np.dtype(np.int64).str)
+        # Geometry of the interacting pairs, at most one pair per interaction
+        specs["pair"] = ((n * n,), np.dtype(np.int64).str)
+        specs["contact"] = ((n * n,), np.dtype(float).str)
+        specs["dcontact"] = ((n * n,), np.dtype(float).str)
+        specs["out_a0"] = ((n,), np.dtype(float).str)
+        specs["out_ttc"] = ((n,), np.dtype(float).str)
+        names = {}
+        for name, (shape, dtype) in specs.items():
+            size = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+            block = SharedMemory(create=True, size=size)
+            self.blocks.append(block)
+            names[name] = block.name
+            self.arrays[name] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+        for name in Swarm.fields:
+            self.arrays[name][...] = getattr(swarm, name)
+        for tasks in self.tasks:
+            worker = self.context.Process(target=work, args=(names, specs, contact, tasks, self.results), daemon=True)
+            worker.start()
+            self.workers.append(worker)
+        shared = Swarm.from_arrays(self.arrays)
+        shared.interactions = swarm.interactions
+        return shared
+
+    def navigate(
+        self,
+        navigators: np.ndarray,
+        indptr: np.ndarray,
+        indices: np.ndarray,
+        shifts: np.ndarray,
+        geometry: Geometry,
+    ) -> tuple:
+        """Run the navigation stage of the given agents in the workers.
+
+        Args:
+            navigators (numpy.ndarray): Positional indices of the agents with interactions.
+            indptr (numpy.ndarray): Offsets of the neighbors of each navigator.
+            indices (numpy.ndarray): Positional indices of the neighbors.
+            shifts (numpy.ndarray): Offsets along x of the neighbors.
+            geometry (Geometry): Geometry of the interacting pairs.
+
+        Returns:
+            tuple: Target directions, None (distances to collision are not returned), times to
+            collision (NaN if not defined) of the navigators and counts of the solver, as in
+            navigate_many.
+        """
+        arrays = self.arrays
+        n_nav = len(navigators)
+        arrays["navigators"][:n_nav] = navigators
+        arrays["indptr"][: n_nav + 1] = indptr
+        arrays["indices"][: len(indices)] = indices
+        arrays["shifts"][: len(shifts)] = shifts
+        arrays["pair"][: len(indices)] = geometry.pair
+        arrays["contact"][: len(geometry)] = geometry.contact
+        arrays["dcontact"][: len(geometry)] = geometry.dcontact
+        # Fixed contiguous ranges of agents, one per worker, even if it has no navigator this step
+        edges = np.linspace(0, len(arrays["navigators"]), self.n_workers + 1).astype(int)
+        bounds = np.searchsorted(navigators, edges)
+        for tasks, lo, hi in zip(self.tasks, bounds[:-1], bounds[1:]):
+            tasks.put((lo, hi))
+        counts = np.zeros(3, dtype=np.int64)
+        for _ in self.tasks:
+            counts += self.collect()
+        return arrays["out_a0"][:n_nav].copy(), None, arrays["out_ttc"][:n_nav].copy(), counts
+
+    def collect(self) -> np.ndarray:
+        """Wait for the result of one range, as long as all the workers are alive.
+
+        Returns:
+            numpy.ndarray: The counts of the solver of the range.
+
+        Raises:
+            RuntimeError: If a worker failed or exited.
+        """
+        while True:
+            try:
+                result = self.results.get(timeout=TIMEOUT)
+            except queue.Empty:
+                for worker in self.workers:
+                    if not worker.is_alive():
+                        raise RuntimeError(f"Navigation worker {worker.pid} exited with code {worker.exitcode}")
+                continue
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+    def close(self) -> None:
+        """Stop the workers and release the shared memory."""
+        for tasks in self.tasks[: len(self.workers)]:
+            tasks.put(None)
+        for worker in self.workers:
+            worker.join(TIMEOUT)
+            if worker.is_alive():
+                worker.terminate()
+        self.workers = []
+        self.arrays = {}
+        for block in self.blocks:
+            try:
+                block.close()
+            except BufferError:
+                # The shared swarm still views the buffer, which is unmapped along with it
+                pass
+            block.unlink()
+        self.blocks = []
+
+
+def work(names: dict, specs: dict, contact: str, tasks, results) -> None:
+    """Worker loop of SharedPool.
+
+    Args:
+        names (dict): Names of the shared memory blocks, keyed by array name.
+        specs (dict): Shapes and dtypes of the arrays, keyed by array name.
+        contact (str): Either "exact" or "table".
+        tasks (Queue): Index ranges into the navigators, those of the agents pinned to this worker, or None
+            to stop.
+        results (Queue): Counts of the solver (see navigate_many) of the completed ranges, or the errors
+            raised.
+    """
+    # Spawned workers do not inherit the thread caps of their parent, one thread per worker
+    set_num_threads(1)
+    blocks = {name: SharedMemory(name=block) for name, block in names.items()}
+    arrays = {name: np.ndarray(shape, dtype=dtype, buffer=blocks[name].buf) for name, (shape, dtype) in specs.items()}
+    swarm = Swarm.from_arrays(arrays)
+    table = contact_table() if contact == "table" else EXACT
+    # Roots of the previous step, for the agents pinned to this worker
+    cache = roots()
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        lo, hi = task
+        try:
+            a0, _, ttc, counts = navigate_many(
+                swarm.x,
+                swarm.y,
+                swarm.vx,
+                swarm.vy,
+                swarm.theta,
+                swarm.speed,
+                swarm.l,
+                swarm.w,
+                swarm.v0,
+                swarm.moto,
+                arrays["navigators"][lo:hi],
+                arrays["indptr"][lo : hi + 1],
+                arrays["indices"],
+                arrays["shifts"],
+                arrays["pair"],
+                arrays["contact"],
+                arrays["dcontact"],
+                table,
+                cache,
+            )
+            arrays["out_a0"][lo:hi] = a0
+            arrays["out_ttc"][lo:hi] = ttc
+        except Exception:
+            # Report the error to the parent instead of leaving it waiting
+            results.put(RuntimeError(f"Navigation of the range {lo}:{hi} failed\n{traceback.format_exc()}"))
+            continue
+        results.put(counts)
+    del swarm, arrays
+    for block in blocks.values():
+        block.close()
@@ -0,0 +1,198 @@
+from math import cos, nan, sin
+
+import numpy as np
+from numba import jit
+
+from pNeuma_simulator.gang.particle import Particle
+
+
+class Swarm:
+    """A struct-of-arrays representation of a population of particles.
+
+    Every per-agent field is stored in a preallocated NumPy array indexed by the
+    positional index of the agent, so that the simulation step runs as whole-array
+    operations instead of walking a list of Particle objects.
+
+    Attributes:
+        n (int): Number of agents.
+        ID (numpy.ndarray): Unique identifiers of the agents (1-based).
+        moto (numpy.ndarray): Boolean mask of the motorcycles.
+        pos (numpy.ndarray): Positions of shape (n, 2).
+        vel (numpy.ndarray): Velocities of shape (n, 2).
+        theta (numpy.ndarray): Angles of the velocities.
+        speed (numpy.ndarray): Magnitudes of the velocities.
+        l (numpy.ndarray): Half lengths.
+        w (numpy.ndarray): Half widths.
+        a (numpy.ndarray): Noise amplitudes.
+        b (numpy.ndarray): Relaxation times.
+        tau (numpy.ndarray): Adaptation times.
+        lam (numpy.ndarray): Slopes at jam spacing.
+        v0 (numpy.ndarray): Desired speeds.
+        s0 (numpy.ndarray): Jam spacings.
+        a0 (numpy.ndarray): Desired directions.
+        gap (numpy.ndarray): Gaps to the leaders.
+        ttc (numpy.ndarray): Times to collision (NaN if not defined).
+        leader (numpy.ndarray): IDs of the leaders (0 if none).
+        interactions (list): Arrays of interacting IDs, one per agent.
+        geometry (Geometry): Geometry of the interacting pairs at the current step (None once the
+            agents have moved).
+    """
+
+    # Names of the per-agent arrays
+    fields = (
+        "ID",
+        "moto",
+        "pos",
+        "vel",
+        "theta",
+        "speed",
+        "l",
+        "w",
+        "a",
+        "b",
+        "tau",
+        "lam",
+        "v0",
+        "s0",
+        "a0",
+        "gap",
+        "ttc",
+        "leader",
+    )
+
+    def __init__(self, agents: list[Particle]):
+        """Initialize the arrays from a list of particles.
+
+        Args:
+            agents (list[Particle]): The particles, in positional order.
+        """
+        n = len(agents)
+        self.n = n
+        self.ID = np.array([agent.ID for agent in agents], dtype=np.int64)
+        self.moto = np.array([agent.mode == "Moto" for agent in agents], dtype=bool)
+        self.pos = np.array([agent.pos for agent in agents], dtype=float).reshape(n, 2)
+        self.vel = np.array([agent.vel for agent in agents], dtype=float).reshape(n, 2)
+        self.theta = np.array([agent.theta for agent in agents], dtype=float)
+        self.speed = np.array([agent.speed for agent in agents], dtype=float)
+        self.l = np.array([agent.l for agent in agents], dtype=float)
+        self.w = np.array([agent.w for agent in agents], dtype=float)
+        self.a = np.array([agent.a for agent in agents], dtype=float)
+        self.b = np.array([agent.b for agent in agents], dtype=float)
+        self.tau = np.array([nan if agent.tau is None else agent.tau for agent in agents], dtype=float)
+        self.lam = np.array([nan if agent.lam is None else agent.lam for agent in agents], dtype=float)
+        self.v0 = np.array([nan if agent.v0 is None else agent.v0 for agent in agents], dtype=float)
+        self.s0 = np.array([nan if agent.s0 is None else agent.s0 for agent in agents], dtype=float)
+        self.a0 = np.array([agent.a0 for agent in agents], dtype=float)
+        self.gap = np.full(n, nan)
+        self.ttc = np.array([nan if agent.ttc is None else agent.ttc for agent in agents], dtype=float)
+        self.leader = np.zeros(n, dtype=np.int64)
+        self.interactions = [np.empty(0, dtype=np.int64) for _ in range(n)]
+        self.geometry = None
+
+    @classmethod
+    def from_arrays(cls, arrays: dict) -> "Swarm":
+        """Build a swarm on top of existing arrays, without copying them.
+
+        Args:
+            arrays (dict): The per-agent arrays, keyed by the names in Swarm.fields.
+
+        Returns:
+            Swarm: A swarm whose fields are the given arrays.
+        """
+        swarm = cls.__new__(cls)
+        for name in cls.fields:
+            setattr(swarm, name, arrays[name])
+        swarm.n = len(swarm.ID)
+        swarm.interactions = [np.empty(0, dtype=np.int64) for _ in range(swarm.n)]
+        swarm.geometry = None
+        return swarm
+
+    def __len__(self):
+        return self.n
+
+    @property
+    def x(self):
+        return self.pos[:, 0]
+
+    @property
+    def y(self):
+        return self.pos[:, 1]
+
+    @property
+    def vx(self):
+        return self.vel[:, 0]
+
+    @property
+    def vy(self):
+        return self.vel[:, 1]
+
+    def particle(self, n: int, shift: float = 0.0) -> Particle:
+        """Return a Particle snapshot of the n-th agent.
+
+        Args:
+            n (int): Positional index of the agent.
+            shift (float, optional): Offset added to the x-coordinate, e.g. +/-L for a periodic image.
+                Defaults to 0.0.
+
+        Returns:
+            Particle: A detached copy of the agent.
+        """
+        mode = "Moto" if self.moto[n] else "Car"
+        agent = Particle(self.pos[n, 0] + shift, self.pos[n, 1], self.speed[n], self.theta[n], mode, self.ID[n])
+        agent.vel = self.vel[n].copy()
+        agent.tau = self.tau[n]
+        agent.lam = self.lam[n]
+        agent.v0 = self.v0[n]
+        agent.s0 = self.s0[n]
+        agent.a0 = self.a0[n]
+        agent.ttc = None if np.isnan(self.ttc[n]) else self.ttc[n]
+        agent.interactions = self.interactions[n].tolist()
+        return agent
+
+    def advance(self, dt: float, new_V: np.ndarray, new_theta: np.ndarray, L: float) -> None:
+        """Advance all the positions according to the new velocities, invalidating the geometry.
+
+        Args:
+            dt (float): Time step in seconds.
+            new_V (numpy.ndarray): New speeds.
+            new_theta (numpy.ndarray): New angles.
+            L (float): Road length in meters for the periodic boundary.
+        """
+        advance(self.pos, self.vel, self.speed, self.theta, dt, new_V, new_theta, L)
+        self.geometry = None
+
+
+@jit(nopython=True)
+def advance(
+    pos: np.ndarray,
+    vel: np.ndarray,
+    speed: np.ndarray,
+    theta: np.ndarray,
+    dt: float,
+    new_V: np.ndarray,
+    new_theta: np.ndarray,
+    L: float,
+) -> None:
+    """
+    Advance the positions in place, mirroring Particle.advance for every agent.
+
+    Args:
+        pos (ndarray): Positions of shape (n, 2).
+        vel (ndarray): Velocities of shape (n, 2).
+        speed (ndarray): Speeds.
+        theta (ndarray): Angles.
+        dt (float): Time step in seconds.
+        new_V (ndarray): New speeds.
+        new_theta (ndarray): New angles.
+        L (float): Road length in meters.
+    """
+    for n in range(len(speed)):
+        theta[n] = new_theta[n]
+        speed[n] = new_V[n]
+        vel[n, 0] = new_V[n] * cos(new_theta[n])
+        vel[n, 1] = new_V[n] * sin(new_theta[n])
+        pos[n, 0] = pos[n, 0] + vel[n, 0] * dt
+        pos[n, 1] = pos[n, 1] + vel[n, 1] * dt
+        # apply periodic boundary conditions
+        if pos[n, 0] > L / 2:
+            pos[n, 0] -= L
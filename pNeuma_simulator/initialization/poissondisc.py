@@ -165,73 +165,23 @@ class PoissonDisc:
         cell_coords = self.get_cell_coords(pt)
         for idx in self.get_neighbours(cell_coords):
             nearby_pt = self.samples[idx]
+            other = nearby_pt
             # Manage periodic boundary conditions
             if nearby_pt.image:
                 image_pt = nearby_pt.image
                 if image_pt.x >= self.width / 2 and cell_coords[0] > (self.nx - 4):
-                    d = ellipses(
-                        pt.l,
-                        pt.w,
-                        image_pt.l,
-                        image_pt.w,
-                        pt.x,
-                        pt.y,
-                        image_pt.x,
-                        image_pt.y,
-                        0,
-                        0,
-                    )
-                    # Squared distance between our candidate point, pt, and this image_pt.
-                    distance2 = (image_pt.x - pt.x) ** 2 + (image_pt.y - pt.y) ** 2
+                    other = image_pt
                 elif image_pt.x < self.width / 2 and cell_coords[0] == 1:
-                    d = ellipses(
-                        pt.l,
-                        pt.w,
-                        image_pt.l,
-                        image_pt.w,
-                        pt.x,
-                        pt.y,
-                        image_pt.x,
-                        image_pt.y,
-                        0,
-                        0,
-                    )
-                    # Squared distance between our candidate point, pt, and this image_pt.
-                    distance2 = (image_pt.x - pt.x) ** 2 + (image_pt.y - pt.y) ** 2
-                else:
-                    d = ellipses(
-                        pt.l,
-                        pt.w,
-                        nearby_pt.l,
-                        nearby_pt.w,
-                        pt.x,
-                        pt.y,
-                        nearby_pt.x,
-                        nearby_pt.y,
-                        0,
-                        0,
-                    )
-                    # Squared distance between our candidate point, pt, and this nearby_pt.
-                    distance2 = (nearby_pt.x - pt.x) ** 2 + (nearby_pt.y - pt.y) ** 2
-            else:
-                d = ellipses(
-                    pt.l,
-                    pt.w,
-                    nearby_pt.l,
-                    nearby_pt.w,
-                    pt.x,
-                    pt.y,
-                    nearby_pt.x,
-                    nearby_pt.y,
-                    0,
-                    0,
-                )
-                # Squared distance between our candidate point, pt, and this nearby_pt.
-                distance2 = (nearby_pt.x - pt.x) ** 2 + (nearby_pt.y - pt.y) ** 2
-            if distance2 < (d + self.clearance) ** 2:
-                # The points are too close, so pt is not a candidate.
+                    other = image_pt
+            # Squared distance between our candidate point, pt, and the other
+            distance2 = (other.x - pt.x) ** 2 + (other.y - pt.y) ** 2
+            # The distance of closest approach lies between the sums of the minor and of the major semiaxes
+            if distance2 < (pt.w + other.w + self.clearance) ** 2:
                 return False
-        # All points tested: if we're here, pt is valid
+            if distance2 < (pt.l + other.l + self.clearance) ** 2:
+                d = ellipses(pt.l, pt.w, other.l, other.w, pt.x, pt.y, other.x, other.y, 0, 0)
+                if distance2 < (d + self.clearance) ** 2:
+                    return False
         return True
 
     def get_point(self, ref_pt: Particle):
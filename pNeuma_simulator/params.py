@@ -1,3 +1,5 @@
+import os
+
 import numpy as np
 
 # Centimeters in inches
@@ -27,6 +29,10 @@ xv, yv = np.meshgrid(x, y)
 yv = np.flip(yv)
 shape = yv.shape
 
+# Spatial index
+bucket = d_max / 2  # minimum width of the buckets of the cell list
+reach = (shape[0] + 2) * grid  # how far the scan of the raster may extend past its walls
+
 # Steady state
 keep = 1 / 3
 
@@ -73,3 +79,7 @@ moto_bounds = [
     (22.5, 50.0),
     (0.10, 3.00),
 ]
+
+# Precomputed tables
+cache = os.path.join(os.path.expanduser("~"), ".cache", "pNeuma_simulator")  # directory
+contact_tolerance = 1e-3  # error bound of the tabulated contact distance in meters
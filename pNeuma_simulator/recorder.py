@@ -0,0 +1,138 @@
+from collections.abc import Sequence
+from math import isnan, nan
+
+import numpy as np
+
+FIELDS = ("x", "y", "speed", "theta", "ttc")
+
+
+class Recorder(Sequence):
+    """A preallocated columnar recorder of trajectories.
+
+    Every frame is written into a block of shape (frames, n_veh, len(FIELDS)) and the static parameters lam, v0
+    and s0 are stored once. The legacy layout (a list of frames, each frame a list of serialized agents) is only
+    built on demand, one frame at a time, when the recorder is indexed or iterated.
+
+    Attributes:
+        data (numpy.ndarray): The recorded fields, of shape (frames, n_veh, len(FIELDS)).
+        lam (numpy.ndarray): Slopes at jam spacing.
+        v0 (numpy.ndarray): Desired speeds.
+        s0 (numpy.ndarray): Jam spacings.
+        moto (numpy.ndarray): Boolean mask of the motorcycles.
+        frames (int): Number of frames recorded so far.
+        stats (dict): Counters of the engine over the run, e.g. the narrow-phase solves saved by the broad phase.
+    """
+
+    def __init__(self, frames: int, n_veh: int, out: np.ndarray | None = None):
+        """Allocate the arrays of the recorder.
+
+        Args:
+            frames (int): Maximum number of frames.
+            n_veh (int): Number of vehicles.
+            out (numpy.ndarray, optional): Preallocated block of shape (frames, n_veh, len(FIELDS)) to write into.
+                Defaults to None.
+        """
+        if out is None:
+            out = np.full((frames, n_veh, len(FIELDS)), nan)
+        self.data = out
+        self.lam = np.full(n_veh, nan)
+        self.v0 = np.full(n_veh, nan)
+        self.s0 = np.full(n_veh, nan)
+        self.moto = np.zeros(n_veh, dtype=bool)
+        self.frames = 0
+        self.stats = {}
+
+    def statics(self, lam: np.ndarray, v0: np.ndarray, s0: np.ndarray, moto: np.ndarray | None = None) -> None:
+        """Store the static parameters of the vehicles.
+
+        Args:
+            lam (numpy.ndarray): Slopes at jam spacing.
+            v0 (numpy.ndarray): Desired speeds.
+            s0 (numpy.ndarray): Jam spacings.
+            moto (numpy.ndarray, optional): Boolean mask of the motorcycles. Defaults to None.
+        """
+        self.lam[:] = lam
+        self.v0[:] = v0
+        self.s0[:] = s0
+        if moto is not None:
+            self.moto[:] = moto
+
+    def record(self, t: int, pos: np.ndarray, speed: np.ndarray, theta: np.ndarray, ttc: np.ndarray) -> None:
+        """Write the state of all the vehicles at frame t.
+
+        Args:
+            t (int): Frame index.
+            pos (numpy.ndarray): Positions of shape (n_veh, 2).
+            speed (numpy.ndarray): Speeds.
+            theta (numpy.ndarray): Angles.
+            ttc (numpy.ndarray): Times to collision (NaN if not defined).
+        """
+        frame = self.data[t]
+        frame[:, 0] = pos[:, 0]
+        frame[:, 1] = pos[:, 1]
+        frame[:, 2] = speed
+        frame[:, 3] = theta
+        frame[:, 4] = ttc
+        self.frames = max(self.frames, t + 1)
+
+    # For convenience, map the recorded fields onto columnar views of
+    # shape (frames, n_veh).
+    @property
+    def x(self):
+        return self.data[: self.frames, :, 0]
+
+    @property
+    def y(self):
+        return self.data[: self.frames, :, 1]
+
+    @property
+    def speed(self):
+        return self.data[: self.frames, :, 2]
+
+    @property
+    def theta(self):
+        return self.data[: self.frames, :, 3]
+
+    @property
+    def ttc(self):
+        return self.data[: self.frames, :, 4]
+
+    def __len__(self):
+        return self.frames
+
+    def __getitem__(self, t):
+        if isinstance(t, slice):
+            return [self.frame(n) for n in range(*t.indices(self.frames))]
+        if t < 0:
+            t += self.frames
+        if not 0 <= t < self.frames:
+            raise IndexError("frame index out of range")
+        return self.frame(t)
+
+    def frame(self, t: int) -> list[dict]:
+        """Serialize frame t in the legacy layout of Particle.encode.
+
+        Args:
+            t (int): Frame index.
+
+        Returns:
+            list[dict]: One dictionary per vehicle.
+        """
+        serial_agents = []
+        for n, (x, y, speed, theta, ttc) in enumerate(self.data[t].tolist()):
+            serial_agent = {"theta": theta, "speed": speed, "ttc": None if isnan(ttc) else ttc}
+            if t == 0:
+                serial_agent["lam"] = float(self.lam[n])
+                serial_agent["v0"] = float(self.v0[n])
+                serial_agent["s0"] = float(self.s0[n])
+            serial_agent["pos"] = [x, y]
+            serial_agents.append(serial_agent)
+        return serial_agents
+
+    def encode(self) -> list[list[dict]]:
+        """Serialize all the frames in the legacy layout.
+
+        Returns:
+            list: The list of serialized agents at each iteration.
+        """
+        return [self.frame(t) for t in range(self.frames)]
@@ -1,6 +1,9 @@
 import json
 import os
+import struct
 import zipfile
+import zlib
+from collections.abc import Sequence
 from math import atan2, cos, sin
 
 import numpy as np
@@ -9,8 +12,9 @@ from numpy.linalg import norm
 from scipy.stats import binned_statistic, bootstrap
 
 from pNeuma_simulator import params
-from pNeuma_simulator.gang import decay
+from pNeuma_simulator.gang import choice_width
 from pNeuma_simulator.initialization import ov
+from pNeuma_simulator.recorder import FIELDS, Recorder
 
 
 def loader(permutation, path: str, verbose: bool = True):
@@ -37,6 +41,414 @@ def loader(permutation, path: str, verbose: bool = True):
     return items
 
 
+# Magic number at both ends of the columnar result files
+MAGIC = b"PNEUMA01"
+# Static parameters of the vehicles stored along the recorded fields
+STATICS = ("lam", "v0", "s0", "moto")
+
+
+class ColumnarWriter:
+    """A streaming writer of simulation results in a compact binary columnar format.
+
+    Each seed is stored as one array of shape (frames, n_veh) per recorded field (see FIELDS) and
+    one array of shape (n_veh,) per static parameter (see STATICS). The fields are cut into chunks
+    of frames, and each chunk is delta-encoded along time on the integer view of its bits (smooth
+    trajectories then leave the high bytes at zero), byte-shuffled (the bytes of equal significance
+    are grouped) and deflated. Both filters are lossless. The JSON header with the shapes and
+    offsets of the chunks comes last, followed by its length and the magic number, so that the
+    seeds are written as they come. The file is written under a temporary name and renamed when
+    closed.
+
+    Attributes:
+        filename (str): Path of the file.
+        chunk (int): Number of frames per chunk.
+        level (int): zlib compression level, or 0 to store the chunks as they are.
+        dtype (numpy.dtype): Floating point type of the fields.
+        meta (dict): Additional entries of the header, e.g. the permutation.
+        items (list): Header entries of the seeds written so far.
+    """
+
+    def __init__(self, filename: str, chunk: int = 256, level: int = 6, dtype: str = "<f8", meta: dict | None = None):
+        """Open the file.
+
+        Args:
+            filename (str): Path of the file.
+            chunk (int, optional): Number of frames per chunk. Defaults to 256.
+            level (int, optional): zlib compression level, or 0 to store the chunks as they are. Defaults to 6.
+            dtype (str, optional): Floating point type of the fields, "<f8" to keep the recorded values exactly
+                or "<f4" for files about three times smaller, at about 1e-7 relative precision. Defaults to "<f8".
+            meta (dict, optional): Additional JSON-serializable entries of the header. Defaults to None.
+        """
+        self.filename = filename
+        self.chunk = chunk
+        self.level = level
+        self.dtype = np.dtype(dtype)
+        self.meta = {} if meta is None else meta
+        self.items = []
+        self.temporary = f"{filename}.{os.getpid()}.tmp"
+        self.file = open(self.temporary, "wb")
+        self.file.write(MAGIC)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        if exc_type is None:
+            self.close()
+        else:
+            # Leave no partial file behind
+            self.file.close()
+            os.remove(self.temporary)
+
+    def write(self, item) -> None:
+        """Append the result of one seed.
+
+        Args:
+            item (tuple): A recorder and an empty list, the position of a collision or (None, None), as
+                returned by batch.
+        """
+        if isinstance(item[0], Recorder):
+            recorder = item[0]
+            entry = {
+                "status": "trajectories",
+                "frames": recorder.frames,
+                "n_veh": recorder.data.shape[1],
+                "columns": {},
+                "statics": {},
+                "stats": recorder.stats,
+            }
+            for f, field in enumerate(FIELDS):
+                column = recorder.data[: recorder.frames, :, f].astype(self.dtype)
+                entry["columns"][field] = [
+                    self.block(column[t : t + self.chunk]) for t in range(0, recorder.frames, self.chunk)
+                ]
+            for name in STATICS:
+                entry["statics"][name] = self.block(getattr(recorder, name))
+        elif item[0] is None:
+            entry = {"status": "none"}
+        else:
+            entry = {"status": "collision", "position": [float(item[0]), float(item[1])]}
+        self.items.append(entry)
+
+    def block(self, array: np.ndarray) -> list:
+        """Write one chunk of an array.
+
+        Args:
+            array (numpy.ndarray): The chunk, of shape (frames, n_veh) for the fields.
+
+        Returns:
+            list: Offset and size in bytes of the chunk in the file.
+        """
+        array = np.ascontiguousarray(array)
+        if self.level:
+            bits = array.view(f"<i{array.itemsize}")
+            if array.ndim == 2:
+                # Wrapping differences of the bits along time
+                bits = np.diff(bits, axis=0, prepend=np.zeros_like(bits[:1]))
+            # Byte planes, then deflate
+            buffer = bits.view(np.uint8).reshape(-1, array.itemsize).T.tobytes()
+            buffer = zlib.compress(buffer, self.level)
+        else:
+            buffer = array.tobytes()
+        offset = self.file.tell()
+        self.file.write(buffer)
+        return [offset, len(buffer)]
+
+    def close(self) -> None:
+        """Write the header and move the file to its final name."""
+        if self.file.closed:
+            return
+        header = {
+            "version": 1,
+            "fields": FIELDS,
+            "statics": STATICS,
+            "dtypes": {
+                **{field: self.dtype.str for field in FIELDS},
+                "lam": "<f8",
+                "v0": "<f8",
+                "s0": "<f8",
+                "moto": "|b1",
+            },
+            "compression": "zlib" if self.level else None,
+            "filters": ["delta", "shuffle"] if self.level else [],
+            "items": self.items,
+            **self.meta,
+        }
+        buffer = json.dumps(header).encode()
+        self.file.write(buffer)
+        self.file.write(struct.pack("<Q", len(buffer)))
+        self.file.write(MAGIC)
+        self.file.close()
+        os.replace(self.temporary, self.filename)
+
+
+def columnar_header(filename: str) -> dict:
+    """Read the JSON header of a columnar result file without its data.
+
+    Args:
+        filename (str): Path of the file (see ColumnarWriter).
+
+    Returns:
+        dict: The header.
+    """
+    with open(filename, "rb") as infile:
+        infile.seek(-len(MAGIC) - 8, os.SEEK_END)
+        (length,) = struct.unpack("<Q", infile.read(8))
+        if infile.read() != MAGIC:
+            raise ValueError(f"Not a columnar result file: {filename}")
+        infile.seek(-len(MAGIC) - 8 - length, os.SEEK_END)
+        return json.loads(infile.read(length))
+
+
+def columnar_loader(filename: str) -> list:
+    """Load the results written by ColumnarWriter.
+
+    Args:
+        filename (str): Path of the file.
+
+    Returns:
+        list: One item per seed as returned by batch, i.e. a recorder (indexable in the legacy layout)
+        and an empty list, the position of a collision or (None, None).
+    """
+    with open(filename, "rb") as infile:
+        buffer = infile.read()
+    if buffer[: len(MAGIC)] != MAGIC or buffer[-len(MAGIC) :] != MAGIC:
+        raise ValueError(f"Not a columnar result file: {filename}")
+    (length,) = struct.unpack("<Q", buffer[-len(MAGIC) - 8 : -len(MAGIC)])
+    header = json.loads(buffer[-len(MAGIC) - 8 - length : -len(MAGIC) - 8])
+    dtypes = {name: np.dtype(dtype) for name, dtype in header["dtypes"].items()}
+    compressed = header["compression"] == "zlib"
+
+    def block(name: str, offset: int, size: int, n_veh: int = 0) -> np.ndarray:
+        dtype = dtypes[name]
+        data = memoryview(buffer)[offset : offset + size]
+        if not compressed:
+            return np.frombuffer(data, dtype=dtype)
+        # Inflate, interleave the byte planes again and accumulate the differences along time
+        planes = np.frombuffer(zlib.decompress(data), dtype=np.uint8)
+        bits = planes.reshape(dtype.itemsize, -1).T.copy().view(f"<i{dtype.itemsize}").ravel()
+        if n_veh:
+            bits = np.cumsum(bits.reshape(-1, n_veh), axis=0, dtype=bits.dtype)
+        return bits.view(dtype).ravel()
+
+    items = []
+    for entry in header["items"]:
+        if entry["status"] == "trajectories":
+            frames, n_veh = entry["frames"], entry["n_veh"]
+            recorder = Recorder(frames, n_veh, out=np.empty((frames, n_veh, len(FIELDS))))
+            for f, field in enumerate(header["fields"]):
+                t = 0
+                for offset, size in entry["columns"][field]:
+                    column = block(field, offset, size, n_veh).reshape(-1, n_veh)
+                    recorder.data[t : t + len(column), :, f] = column
+                    t += len(column)
+            recorder.statics(*(block(name, *entry["statics"][name]) for name in STATICS))
+            recorder.frames = frames
+            recorder.stats = entry["stats"]
+            items.append((recorder, []))
+        elif entry["status"] == "collision":
+            items.append(tuple(entry["position"]))
+        else:
+            items.append((None, None))
+    return items
+
+
+def decode(item, n_cars: int):
+    """Rebuild the result of one seed from the legacy layout of the JSONL archives.
+
+    Args:
+        item (list): The frames of the serialized agents and an empty list, the position of a collision or
+            [None, None].
+        n_cars (int): Number of cars per lane (the first 2 * n_cars agents are cars).
+
+    Returns:
+        tuple: A recorder and an empty list, the position of a collision or (None, None).
+    """
+    if not isinstance(item[0], list):
+        return tuple(item)
+    frames = item[0]
+    n_veh = len(frames[0])
+    recorder = Recorder(len(frames), n_veh)
+    for t, frame in enumerate(frames):
+        pos = array([agent["pos"] for agent in frame], dtype=float).reshape(n_veh, 2)
+        if "vel" in frame[0]:
+            vel = array([agent["vel"] for agent in frame], dtype=float).reshape(n_veh, 2)
+            speed, theta = norm(vel, axis=1), np.arctan2(vel[:, 1], vel[:, 0])
+        else:
+            speed = array([agent["speed"] for agent in frame], dtype=float)
+            theta = array([agent["theta"] for agent in frame], dtype=float)
+        ttc = array([np.nan if agent["ttc"] is None else agent["ttc"] for agent in frame], dtype=float)
+        recorder.record(t, pos, speed, theta, ttc)
+    recorder.statics(
+        [agent["lam"] for agent in frames[0]],
+        [agent["v0"] for agent in frames[0]],
+        [agent["s0"] if "s0" in agent else agent["d"] for agent in frames[0]],
+        np.arange(n_veh) >= 2 * n_cars,
+    )
+    return (recorder, [])
+
+
+def convert(archive: str, filename: str, n_cars: int, **kwargs) -> None:
+    """Convert a JSONL archive (see zipdir) to a columnar result file, one seed at a time.
+
+    Args:
+        archive (str): Path of the zip archive.
+        filename (str): Path of the columnar file.
+        n_cars (int): Number of cars per lane.
+        **kwargs: Keyword arguments of ColumnarWriter.
+    """
+    with zipfile.ZipFile(archive, "r") as ziph, ColumnarWriter(filename, **kwargs) as writer:
+        for name in ziph.namelist():
+            if name.endswith(".jsonl"):
+                with ziph.open(name, "r") as infile:
+                    for line in infile:
+                        writer.write(decode(json.loads(line), n_cars))
+
+
+# Status of the seeds in a memory-mapped output, in the order of their codes
+STATUSES = ("pending", "trajectories", "collision", "none")
+
+
+class MemmapOutput:
+    """Memory-mapped results of all the seeds of one permutation, shared by the workers.
+
+    The recorded fields of all the seeds are preallocated as one array of shape (epochs, frames, n_veh,
+    len(FIELDS)) in a directory of .npy files, together with the statics and a per-seed status. Each worker
+    records its seed straight into its slice (see recorder), so that the trajectories are never pickled back
+    to the parent process, and marks the seed once its slice is flushed (see write). A seed is thus either
+    complete or still pending, which lets an interrupted job resume from the status array.
+
+    Attributes:
+        dirname (str): Path of the directory.
+        data (numpy.memmap): The recorded fields, of shape (epochs, frames, n_veh, len(FIELDS)).
+        status (numpy.memmap): Index in STATUSES of the status of each seed.
+        frames (numpy.memmap): Number of frames recorded for each seed.
+        position (numpy.memmap): Position of the collision of each seed (NaN if none).
+        lam (numpy.memmap): Slopes at jam spacing, of shape (epochs, n_veh).
+        v0 (numpy.memmap): Desired speeds.
+        s0 (numpy.memmap): Jam spacings.
+        moto (numpy.memmap): Boolean masks of the motorcycles.
+    """
+
+    def __init__(self, dirname: str, shape: tuple | None = None, dtype: str = "<f8"):
+        """Allocate the arrays, or open those of an existing directory.
+
+        Args:
+            dirname (str): Path of the directory.
+            shape (tuple, optional): Number of epochs, frames and vehicles, to allocate the arrays if they do not
+                exist yet. Defaults to None.
+            dtype (str, optional): Floating point type of the fields. Defaults to "<f8".
+
+        Raises:
+            ValueError: If the existing arrays do not have the given shape.
+        """
+        self.dirname = dirname
+        # The status is allocated last, so that its presence marks a complete allocation
+        if shape is not None and not os.path.exists(os.path.join(dirname, "status.npy")):
+            epochs, frames, n_veh = shape
+            os.makedirs(dirname, exist_ok=True)
+            # The file of the fields is left sparse until the workers write into it
+            self.open("data", "w+", dtype, (epochs, frames, n_veh, len(FIELDS)))
+            self.open("frames", "w+", "<i8", (epochs,))
+            self.open("position", "w+", "<f8", (epochs, 2))[:] = np.nan
+            for name in STATICS:
+                self.open(name, "w+", "|b1" if name == "moto" else "<f8", (epochs, n_veh))
+            for name in ("frames", "position", *STATICS):
+                getattr(self, name).flush()
+            self.open("status", "w+", "|i1", (epochs,)).flush()
+        for name in ("data", "frames", "position", *STATICS, "status"):
+            self.open(name, "r+")
+        if shape is not None and self.data.shape[:3] != tuple(shape):
+            raise ValueError(f"Shape {self.data.shape[:3]} of {dirname} does not match {tuple(shape)}")
+
+    def open(self, name: str, mode: str, dtype: str | None = None, shape: tuple | None = None) -> np.memmap:
+        """Map one array of the directory onto an attribute.
+
+        Args:
+            name (str): Name of the array.
+            mode (str): "w+" to create the file, "r+" to open it.
+            dtype (str, optional): Type of the array, when created. Defaults to None.
+            shape (tuple, optional): Shape of the array, when created. Defaults to None.
+
+        Returns:
+            numpy.memmap: The array.
+        """
+        array = np.lib.format.open_memmap(os.path.join(self.dirname, f"{name}.npy"), mode, dtype, shape)
+        setattr(self, name, array)
+        return array
+
+    def __len__(self):
+        return len(self.status)
+
+    def done(self) -> np.ndarray:
+        """Epochs of the seeds already written.
+
+        Returns:
+            numpy.ndarray: Indices along the first axis.
+        """
+        return np.flatnonzero(self.status)
+
+    def recorder(self, epoch: int) -> Recorder:
+        """A recorder writing the fields of one seed straight into its slice.
+
+        Args:
+            epoch (int): Index of the seed along the first axis.
+
+        Returns:
+            Recorder: The recorder.
+        """
+        return Recorder(self.data.shape[1], self.data.shape[2], out=self.data[epoch])
+
+    def write(self, epoch: int, item, recorder: Recorder) -> str:
+        """Complete the slice of one seed once it is simulated, then mark its status.
+
+        Args:
+            epoch (int): Index of the seed along the first axis.
+            item (tuple): The result of the seed, as returned by batch.
+            recorder (Recorder): The recorder of the seed (see recorder), also kept for collisions.
+
+        Returns:
+            str: The status of the seed.
+        """
+        if isinstance(item[0], Recorder):
+            status = "trajectories"
+        elif item[0] is None:
+            status = "none"
+        else:
+            status = "collision"
+            self.position[epoch] = item[:2]
+        self.frames[epoch] = recorder.frames
+        for name in STATICS:
+            getattr(self, name)[epoch] = getattr(recorder, name)
+        for name in ("data", "frames", "position", *STATICS):
+            getattr(self, name).flush()
+        # Only flag the seed once its data is on disk
+        self.status[epoch] = STATUSES.index(status)
+        self.status.flush()
+        return status
+
+    def items(self) -> list:
+        """The results of the seeds written so far, without copying the fields.
+
+        Returns:
+            list: One item per written seed as returned by batch, i.e. a recorder (viewing the memory map) and
+            an empty list, the position of a collision or (None, None).
+        """
+        items = []
+        for epoch in self.done():
+            status = STATUSES[self.status[epoch]]
+            if status == "trajectories":
+                recorder = self.recorder(epoch)
+                recorder.statics(*(getattr(self, name)[epoch] for name in STATICS))
+                recorder.frames = int(self.frames[epoch])
+                items.append((recorder, []))
+            elif status == "collision":
+                items.append(tuple(self.position[epoch].tolist()))
+            else:
+                items.append((None, None))
+        return items
+
+
 def aggregate(l_agents, n_cars: int, n_moto: int):
     """Calculate various aggregate metrics based on the given list of agents.
 
@@ -213,7 +625,8 @@ def percolate(items, n_cars, n_moto, rng, start: int = 1):
     l_DPhi_2 = []
     l_DPhi_4 = []
     for item in items:
-        if isinstance(item[0], list):
+        # Collisions are stored as a bare position
+        if isinstance(item[0], Sequence):
             n_veh = 2 * n_cars + n_moto
             lam = empty(shape=n_veh, dtype=float)
             v0 = empty(shape=n_veh, dtype=float)
@@ -233,19 +646,18 @@ def percolate(items, n_cars, n_moto, rng, start: int = 1):
                     vel_car = []
                     vel_x = []
                     vel_y = []
+                    previous = item[0][t - 1]
                     for j, _ in enumerate(frame):
                         try:
-                            speed = item[0][t - 1][j]["speed"]
-                            theta = item[0][t - 1][j]["theta"]
+                            speed = previous[j]["speed"]
+                            theta = previous[j]["theta"]
                         except:
-                            speed = norm(item[0][t - 1][j]["vel"])
-                            theta = atan2(item[0][t - 1][j]["vel"][1], item[0][t - 1][j]["vel"][0])
+                            speed = norm(previous[j]["vel"])
+                            theta = atan2(previous[j]["vel"][1], previous[j]["vel"][0])
                         if j <= 2 * n_cars - 1:
                             vel_car.append(speed / v_max[j])
                         else:
-                            alphas = decay(speed, theta)
-                            degs = np.round(np.degrees(alphas), 2)
-                            deg_range.append(degs[0] - degs[-1])
+                            deg_range.append(choice_width(speed))
                             vel_x.append(speed * cos(theta) / v_max[j])
                             vel_y.append(speed * sin(theta) / v_max[j])
                     l_T.append(np.mean(deg_range))
@@ -287,20 +699,20 @@ def polarize(items, n_cars, n_moto, rng, start: int = 1):
     l_T = []
     l_phi = []
     for item in items:
-        if isinstance(item[0], list):
+        # Collisions are stored as a bare position
+        if isinstance(item[0], Sequence):
             for t, frame in enumerate(item[0]):
                 if t > start:
                     deg_range = []
                     direction = np.array([0.0, 0.0])
+                    previous = item[0][t - 1]
                     for j, _ in enumerate(frame):
-                        speed = item[0][t - 1][j]["speed"]
-                        theta = item[0][t - 1][j]["theta"]
+                        speed = previous[j]["speed"]
+                        theta = previous[j]["theta"]
                         if j <= 2 * n_cars - 1:
                             pass
                         else:
-                            alphas = decay(speed, theta)
-                            degs = np.round(np.degrees(alphas), 2)
-                            deg_range.append(degs[0] - degs[-1])
+                            deg_range.append(choice_width(speed))
                             direction += np.array([np.cos(theta), np.sin(theta)])
                     l_T.append(np.mean(deg_range))
                     phi = norm(direction) / n_moto
@@ -1,2 +1,5 @@
-from .fov import FoV, Row, Quadrant  # noqa F401
-from .shadowcasting import shadowcasting  # noqa F401
+from .fov import FoV, Row, Quadrant, visibility  # noqa F401
+from .shadowcasting import horizon, shadowcasting  # noqa F401
+from .occlusion import occlusion, subtend  # noqa F401
+from .raster import Raster  # noqa F401
+from .templates import build, cast, templates  # noqa F401
@@ -1,6 +1,9 @@
 from fractions import Fraction
 from math import ceil, floor
 
+import numpy as np
+from numba import jit
+
 
 class FoV:
     """
@@ -169,3 +172,106 @@ class Row:
             Row: The next row with incremented depth and the same slopes.
         """
         return Row(self.depth + 1, self.start_slope, self.end_slope)
+
+
+@jit(nopython=True)
+def visibility(matrix: np.ndarray, ox: int, oy: int, walls: np.ndarray) -> np.ndarray:
+    """Compiled symmetric shadowcasting, equivalent to FoV.compute_fov.
+
+    Args:
+        matrix (np.ndarray): background grid, where cells > 0 are blocking
+        ox (int): column of the origin
+        oy (int): row of the origin
+        walls (np.ndarray): columns of the temporary walls
+
+    Returns:
+        np.ndarray: boolean mask of the visible cells
+    """
+    height, width = matrix.shape
+    return scan(matrix, matrix, -1, ox, oy, 0, walls, 0, width - 1)
+
+
+@jit(nopython=True)
+def scan(
+    top: np.ndarray,
+    prev: np.ndarray,
+    ID: int,
+    ox: int,
+    oy: int,
+    roll: int,
+    walls: np.ndarray,
+    x_lo: int,
+    x_hi: int,
+) -> np.ndarray:
+    """Compiled symmetric shadowcasting on a periodic window of a label raster.
+
+    Slopes are kept as pairs of integers (numerator, denominator) instead of Fractions, and
+    the recursive scan is replaced by an explicit stack of rows. Columns are expressed in the
+    frame rolled by roll, and mapped back to the raster with modular indexing so that no
+    rolled copy is needed. The cells labelled ID are read from prev instead of top, which
+    makes the ego vehicle transparent. Out-of-range rows follow Python's negative indexing
+    as in FoV.is_blocking.
+
+    Args:
+        top (np.ndarray): label raster, where cells > 0 are blocking
+        prev (np.ndarray): labels under the cells labelled ID
+        ID (int): label of the ego vehicle (-1 if none)
+        ox (int): column of the origin in the rolled frame
+        oy (int): row of the origin
+        roll (int): number of columns the raster is rolled by
+        walls (np.ndarray): columns of the temporary walls in the rolled frame
+        x_lo (int): first column of the window in the rolled frame
+        x_hi (int): last column of the window in the rolled frame
+
+    Returns:
+        np.ndarray: boolean mask of the visible cells of the window
+    """
+    height, width = top.shape
+    is_visible = np.zeros((height, x_hi - x_lo + 1), dtype=np.bool_)
+    is_visible[oy, ox - x_lo] = True
+    # rows as (depth, start numerator, start denominator, end numerator, end denominator)
+    stack = np.empty((2 * height * (x_hi - x_lo + 1) + 8, 5), dtype=np.int64)
+    for cardinal in range(4):
+        top_row = 0
+        stack[top_row] = (1, -1, 1, 1, 1)
+        top_row += 1
+        while top_row > 0:
+            top_row -= 1
+            depth, sn, sd, en, ed = stack[top_row]
+            # round_ties_up(depth * start_slope) and round_ties_down(depth * end_slope)
+            min_col = (2 * depth * sn + sd) // (2 * sd)
+            max_col = -((ed - 2 * depth * en) // (2 * ed))
+            prev_tile = -1  # None, floor (0) or wall (1)
+            for col in range(min_col, max_col + 1):
+                # transform (depth, col) according to the quadrant
+                if cardinal == 0:
+                    x, y = ox + col, oy - depth
+                elif cardinal == 1:
+                    x, y = ox + depth, oy + col
+                elif cardinal == 2:
+                    x, y = ox + col, oy + depth
+                else:
+                    x, y = ox - depth, oy + col
+                xx = x + width if x < 0 else x
+                yy = y + height if y < 0 else y
+                if 0 <= xx < width and 0 <= yy < height:
+                    label = top[yy, (xx - roll) % width]
+                    if label == ID:
+                        label = prev[yy, (xx - roll) % width]
+                    tile = 1 if label > 0 or xx == walls[0] or xx == walls[1] else 0
+                else:
+                    tile = 1
+                # reveal walls and symmetric floors
+                if tile == 1 or (col * sd >= depth * sn and col * ed <= depth * en):
+                    if x_lo <= x <= x_hi and 0 <= y < height:
+                        is_visible[y, x - x_lo] = True
+                if prev_tile == 1 and tile == 0:
+                    sn, sd = 2 * col - 1, 2 * depth
+                if prev_tile == 0 and tile == 1:
+                    stack[top_row] = (depth + 1, sn, sd, 2 * col - 1, 2 * depth)
+                    top_row += 1
+                prev_tile = tile
+            if prev_tile == 0:
+                stack[top_row] = (depth + 1, sn, sd, en, ed)
+                top_row += 1
+    return is_visible
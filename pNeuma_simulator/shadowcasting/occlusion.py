@@ -0,0 +1,212 @@
+from math import acos, atan2, cos, pi, sin, sqrt
+
+import numpy as np
+from numba import jit
+
+from pNeuma_simulator.utils import periodic_shift
+
+
+@jit(nopython=True)
+def subtend(x_o: float, y_o: float, x: float, y: float, theta: float, a: float, b: float) -> tuple:
+    """
+    Angular interval subtended by an ellipse as seen from a point.
+
+    The point and the ellipse are mapped onto the unit circle, where the tangent points are
+    known in closed form, and the tangent points are mapped back (tangency is preserved by
+    affine maps).
+
+    Args:
+        x_o (float): The x-coordinate of the point of view.
+        y_o (float): The y-coordinate of the point of view.
+        x (float): The x-coordinate of the center of the ellipse.
+        y (float): The y-coordinate of the center of the ellipse.
+        theta (float): The angle of the major axis.
+        a (float): The major semiaxis.
+        b (float): The minor semiaxis.
+
+    Returns:
+        tuple: The lower and upper bearings, or NaN if the point lies inside the ellipse.
+    """
+    c, s = cos(theta), sin(theta)
+    dx, dy = x_o - x, y_o - y
+    # Point of view in the frame of the ellipse, scaled to the unit circle
+    u = (dx * c + dy * s) / a
+    v = (-dx * s + dy * c) / b
+    r = sqrt(u**2 + v**2)
+    if r <= 1:
+        return np.nan, np.nan
+    phi = atan2(v, u)
+    delta = acos(1 / r)
+    # Bearing of the center, the tangents are measured relative to it
+    center = atan2(-dy, -dx)
+    lo, hi = np.inf, -np.inf
+    for psi in (phi - delta, phi + delta):
+        tx = x + a * cos(psi) * c - b * sin(psi) * s
+        ty = y + a * cos(psi) * s + b * sin(psi) * c
+        offset = atan2(ty - y_o, tx - x_o) - center
+        if offset > pi:
+            offset -= 2 * pi
+        elif offset < -pi:
+            offset += 2 * pi
+        lo = min(lo, offset)
+        hi = max(hi, offset)
+    return center + lo, center + hi
+
+
+@jit(nopython=True)
+def occlusion(
+    n: int,
+    x: np.ndarray,
+    y: np.ndarray,
+    theta: np.ndarray,
+    a: np.ndarray,
+    b: np.ndarray,
+    ID: np.ndarray,
+    L: float,
+    d_max: float,
+    others: np.ndarray,
+) -> np.ndarray:
+    """
+    Continuous visibility of the agents ahead of an ego vehicle.
+
+    Every agent overlapping the stretch of road between the ego and its horizon is reduced to
+    the angular interval its ellipse subtends from the center of the ego. The intervals are
+    swept by increasing distance and an agent is visible if its interval is not entirely
+    covered by the union of the intervals of the agents in front of it.
+
+    Args:
+        n (int): Positional index of the ego vehicle.
+        x (ndarray): The x-coordinates of the agents.
+        y (ndarray): The y-coordinates of the agents.
+        theta (ndarray): The angles of the agents.
+        a (ndarray): The major semiaxes of the agents.
+        b (ndarray): The minor semiaxes of the agents.
+        ID (ndarray): The IDs of the agents.
+        L (float): The road length.
+        d_max (float): The horizon distance.
+        others (ndarray): Positional indices of the candidate agents (e.g. from a cell list).
+
+    Returns:
+        ndarray: The sorted IDs of the visible agents.
+    """
+    N = len(others)
+    distances = np.empty(N)
+    lows = np.empty(N)
+    highs = np.empty(N)
+    candidates = np.empty(N, dtype=np.int64)
+    k = 0
+    for j in others:
+        if j == n:
+            continue
+        x_j = x[j] + periodic_shift(x[n], x[j], L)
+        dx, dy = x_j - x[n], y[j] - y[n]
+        # Half extent of the ellipse along the road
+        extent = sqrt((a[j] * cos(theta[j])) ** 2 + (b[j] * sin(theta[j])) ** 2)
+        if dx + extent <= 0 or dx - extent >= d_max:
+            continue
+        lows[k], highs[k] = subtend(x[n], y[n], x_j, y[j], theta[j], a[j], b[j])
+        distances[k] = sqrt(dx**2 + dy**2)
+        candidates[k] = j
+        k += 1
+    order = np.argsort(distances[:k])
+    # Disjoint covered intervals within [-pi, pi], sorted by lower bound
+    starts = np.empty(2 * k)
+    ends = np.empty(2 * k)
+    m = 0
+    visible = np.empty(k, dtype=ID.dtype)
+    v = 0
+    for i in order:
+        if np.isnan(lows[i]):
+            # The ego is in contact with the agent, which does not occlude anything
+            visible[v] = ID[candidates[i]]
+            v += 1
+            continue
+        # An interval across the rear bearing is split in two
+        lo, hi, lo_w, hi_w = wrap(lows[i], highs[i])
+        if covered(starts, ends, m, lo, hi) and (np.isnan(lo_w) or covered(starts, ends, m, lo_w, hi_w)):
+            continue
+        visible[v] = ID[candidates[i]]
+        v += 1
+        m = merge(starts, ends, m, lo, hi)
+        if not np.isnan(lo_w):
+            m = merge(starts, ends, m, lo_w, hi_w)
+    return np.sort(visible[:v])
+
+
+@jit(nopython=True)
+def wrap(lo: float, hi: float) -> tuple:
+    """
+    Map an angular interval onto [-pi, pi].
+
+    Args:
+        lo (float): The lower bearing.
+        hi (float): The upper bearing, less than a turn above lo.
+
+    Returns:
+        tuple: The bounds of the interval and, if it wraps around the rear bearing, of its part
+        from -pi (NaN otherwise).
+    """
+    width = hi - lo
+    lo = (lo + pi) % (2 * pi) - pi
+    hi = lo + width
+    if hi <= pi:
+        return lo, hi, np.nan, np.nan
+    return lo, pi, -pi, hi - 2 * pi
+
+
+@jit(nopython=True)
+def covered(starts: np.ndarray, ends: np.ndarray, m: int, lo: float, hi: float) -> bool:
+    """
+    Whether an interval lies within one of the covered intervals.
+
+    Args:
+        starts (ndarray): The lower bounds of the covered intervals.
+        ends (ndarray): Their upper bounds.
+        m (int): The number of covered intervals.
+        lo (float): The lower bound of the interval.
+        hi (float): Its upper bound.
+
+    Returns:
+        bool: True if the interval is covered.
+    """
+    for p in range(m):
+        if starts[p] <= lo and hi <= ends[p]:
+            return True
+    return False
+
+
+@jit(nopython=True)
+def merge(starts: np.ndarray, ends: np.ndarray, m: int, lo: float, hi: float) -> int:
+    """
+    Merge an interval into the covered intervals, in place.
+
+    Args:
+        starts (ndarray): The lower bounds of the disjoint covered intervals, sorted.
+        ends (ndarray): Their upper bounds.
+        m (int): The number of covered intervals.
+        lo (float): The lower bound of the interval.
+        hi (float): Its upper bound.
+
+    Returns:
+        int: The new number of covered intervals.
+    """
+    p = 0
+    while p < m and ends[p] < lo:
+        p += 1
+    q = p
+    while q < m and starts[q] <= hi:
+        lo = min(lo, starts[q])
+        hi = max(hi, ends[q])
+        q += 1
+    shift = 1 - (q - p)
+    if shift > 0:
+        for r in range(m - 1, q - 1, -1):
+            starts[r + shift] = starts[r]
+            ends[r + shift] = ends[r]
+    elif shift < 0:
+        for r in range(q, m):
+            starts[r + shift] = starts[r]
+            ends[r + shift] = ends[r]
+    starts[p] = lo
+    ends[p] = hi
+    return m + shift
@@ -0,0 +1,120 @@
+from math import ceil, cos, floor, pi, sin
+
+import numpy as np
+from numba import jit
+
+
+class Raster:
+    """A label raster of the road occupancy shared by all the agents.
+
+    The occupancy is rasterized once per step. Each cell stores the ID of the last agent
+    painted on it (top) and the last ID painted on it by a different agent (prev), so that
+    the view of an ego vehicle, in which the ego itself is transparent, is derived by
+    masking its own ID (see horizon). The outer rows are walls labelled 1.
+
+    Ellipses are only evaluated on the cells of their bounding box, so the cost of building
+    the raster does not depend on the road length.
+
+    Attributes:
+        xv (numpy.ndarray): The x-coordinates of the cell centers.
+        yv (numpy.ndarray): The y-coordinates of the cell centers (decreasing along the rows).
+        shape (tuple): The shape of the background grid.
+        grid (float): The cell size.
+        top (numpy.ndarray): The IDs of the last agents painted on each cell.
+        prev (numpy.ndarray): The IDs painted just before by a different agent.
+        boxes (list): The bounding boxes painted since the last reset.
+    """
+
+    def __init__(self, xv: np.ndarray, yv: np.ndarray):
+        """Allocate the label raster.
+
+        Args:
+            xv (numpy.ndarray): The x-coordinates of the cell centers.
+            yv (numpy.ndarray): The y-coordinates of the cell centers.
+        """
+        self.xv = xv
+        self.yv = yv
+        self.shape = xv.shape
+        self.grid = xv[0, 1] - xv[0, 0]
+        self.top = np.zeros(self.shape, dtype=np.int64)
+        self.prev = np.zeros(self.shape, dtype=np.int64)
+        self.top[[0, -1]] = 1
+        self.prev[[0, -1]] = 1
+        self.boxes = []
+
+    def reset(self) -> None:
+        """Clear the painted cells, keeping only the walls."""
+        for r0, r1, c0, c1 in self.boxes:
+            self.top[r0:r1, c0:c1] = 0
+            self.prev[r0:r1, c0:c1] = 0
+        self.top[[0, -1]] = 1
+        self.prev[[0, -1]] = 1
+        self.boxes = []
+
+    def box(self, x: float, y: float, reach: float) -> tuple:
+        """Return the slices of the cells within reach of a point, clipped to the grid.
+
+        Args:
+            x (float): The x-coordinate of the point.
+            y (float): The y-coordinate of the point.
+            reach (float): The half size of the box.
+
+        Returns:
+            tuple: The first and last (excluded) rows and columns.
+        """
+        height, width = self.shape
+        # One extra cell on each side guards against rounding
+        c0 = max(floor((x - reach - self.xv[0, 0]) / self.grid) - 1, 0)
+        c1 = min(ceil((x + reach - self.xv[0, 0]) / self.grid) + 2, width)
+        r0 = max(floor((self.yv[0, 0] - (y + reach)) / self.grid) - 1, 0)
+        r1 = min(ceil((self.yv[0, 0] - (y - reach)) / self.grid) + 2, height)
+        return r0, r1, c0, c1
+
+    def ellipse(self, x: float, y: float, theta: float, a: float, b: float, ID: int):
+        """Paint the cells inside an ellipse with the given ID.
+
+        Args:
+            x (float): The x-coordinate of the center.
+            y (float): The y-coordinate of the center.
+            theta (float): The angle of the major axis.
+            a (float): The major semiaxis.
+            b (float): The minor semiaxis.
+            ID (int): The ID of the agent.
+
+        Returns:
+            tuple: The cell of the grid closest to the center (origin), or None if the ellipse is off the grid.
+        """
+        r0, r1, c0, c1 = self.box(x, y, max(a, b))
+        if r0 >= r1 or c0 >= c1:
+            return None
+        cos_angle = cos(pi - theta)
+        sin_angle = sin(pi - theta)
+        xc = self.xv[r0:r1, c0:c1] - x
+        yc = self.yv[r0:r1, c0:c1] - y
+        # https://stackoverflow.com/questions/37031356/
+        xct = xc * cos_angle - yc * sin_angle
+        yct = xc * sin_angle + yc * cos_angle
+        rad = xct**2 / a**2 + yct**2 / b**2
+        paint(self.top[r0:r1, c0:c1], self.prev[r0:r1, c0:c1], rad, ID)
+        self.boxes.append((r0, r1, c0, c1))
+        row, col = np.unravel_index(rad.argmin(), rad.shape)
+        return (r0 + row, c0 + col)
+
+
+@jit(nopython=True)
+def paint(top: np.ndarray, prev: np.ndarray, rad: np.ndarray, ID: int) -> None:
+    """
+    Paints the cells of the label raster where the radius is smaller than one.
+
+    Args:
+        top (ndarray): The IDs of the last agents painted on each cell.
+        prev (ndarray): The IDs painted just before by a different agent.
+        rad (ndarray): The normalized radii of the cells.
+        ID (int): The ID to paint.
+    """
+    height, width = rad.shape
+    for i in range(height):
+        for j in range(width):
+            if rad[i, j] < 1 and top[i, j] != ID:
+                prev[i, j] = top[i, j]
+                top[i, j] = ID
@@ -1,6 +1,7 @@
 import numpy as np
+from numba import jit
 
-from pNeuma_simulator.shadowcasting.fov import FoV
+from pNeuma_simulator.shadowcasting.fov import scan, visibility
 
 
 def shadowcasting(matrix: np.ndarray, origin: tuple, grid: float, L: float, d_max: float) -> list:
@@ -20,17 +21,74 @@ def shadowcasting(matrix: np.ndarray, origin: tuple, grid: float, L: float, d_ma
     roll = int(width / 2 - origin[1])
     origin = (origin[1] + roll, origin[0])
     df = np.roll(matrix, roll, axis=1)
-    # Add temporary walls
-    df[:, [int(-1 + (L / 2) / grid), int(1 + (L / 2 + d_max) / grid)]] += 1
-    fov = FoV(df, origin)
-    is_visible = fov.compute_fov()
+    # Temporary walls
+    walls = np.array([int(-1 + (L / 2) / grid), int(1 + (L / 2 + d_max) / grid)])
+    is_visible = visibility(df, origin[0], origin[1], walls)
     # Remove all the walls
-    df[:, [int(-1 + (L / 2) / grid), int(1 + (L / 2 + d_max) / grid)]] -= 1
     df[[0, -1]] = 0
-    for y in range(height):
-        for x in range(width):
-            if (x, y) not in is_visible:
-                df[y, x] = 0
-    interactions = np.unique(df)[1:]
+    interactions = np.unique(df[is_visible])
     interactions = interactions[interactions > 0]
     return interactions
+
+
+def horizon(top: np.ndarray, prev: np.ndarray, ID: int, origin: tuple, grid: float, L: float, d_max: float) -> list:
+    """Shadowcasting restricted to a periodic window around the horizon of an agent.
+
+    Equivalent to shadowcasting on the view of the agent, but the label raster is neither
+    copied nor rolled: only the columns between the agent and its horizon are scanned,
+    through modular indexing.
+
+    Args:
+        top (np.ndarray): label raster (see Raster)
+        prev (np.ndarray): labels under the cells labelled ID (see Raster)
+        ID (int): ID of the ego agent
+        origin (tuple): position on the grid
+        grid (float): grid size in meters
+        L (float): road length in meters
+        d_max (float): horizon distance
+
+    Returns:
+        list: list of interactions
+    """
+    height, width = top.shape
+    roll = int(width / 2 - origin[1])
+    ox, oy = origin[1] + roll, origin[0]
+    # Temporary walls in the rolled frame
+    walls = np.array([int(-1 + (L / 2) / grid), int(1 + (L / 2 + d_max) / grid)])
+    # Diagonal quadrants can look past the walls by at most the height of the grid
+    x_lo = max(min(walls[0], ox - height - 1), 0)
+    x_hi = min(max(walls[1], ox + height + 1), width - 1)
+    is_visible = scan(top, prev, ID, ox, oy, roll, walls, x_lo, x_hi)
+    return gather(top, prev, ID, is_visible, roll, x_lo)
+
+
+@jit(nopython=True)
+def gather(top: np.ndarray, prev: np.ndarray, ID: int, is_visible: np.ndarray, roll: int, x_lo: int) -> np.ndarray:
+    """Collects the labels of the visible cells of a window, without the walls.
+
+    Args:
+        top (np.ndarray): label raster
+        prev (np.ndarray): labels under the cells labelled ID
+        ID (int): label of the ego vehicle
+        is_visible (np.ndarray): boolean mask of the visible cells of the window
+        roll (int): number of columns the raster is rolled by
+        x_lo (int): first column of the window in the rolled frame
+
+    Returns:
+        np.ndarray: sorted unique positive labels
+    """
+    height, width = top.shape
+    labels = np.empty(is_visible.size, dtype=top.dtype)
+    k = 0
+    # The outer rows are walls
+    for y in range(1, height - 1):
+        for i in range(is_visible.shape[1]):
+            if is_visible[y, i]:
+                c = (x_lo + i - roll) % width
+                label = top[y, c]
+                if label == ID:
+                    label = prev[y, c]
+                if label > 0:
+                    labels[k] = label
+                    k += 1
+    return np.unique(labels[:k])
@@ -0,0 +1,137 @@
+import os
+
+import numpy as np
+from numba import jit
+
+from pNeuma_simulator import params
+
+
+def templates(L: float, lane: float, grid: float, d_max: float, cache: str | bool | None = None) -> tuple:
+    """Load the ray templates of a grid configuration, building and caching them if needed.
+
+    Args:
+        L (float): road length in meters
+        lane (float): half width of the road in meters
+        grid (float): grid size in meters
+        d_max (float): horizon distance
+        cache (str, optional): directory of the cached tables, None for params.cache as set when called, or False
+            to disable the cache. Defaults to None.
+
+    Returns:
+        tuple: cells, rays and rows (see build)
+    """
+    if cache is None:
+        cache = params.cache
+    if not cache:
+        return build(L, lane, grid, d_max)
+    filename = os.path.join(cache, f"rays_L{L}_lane{lane}_grid{grid}_dmax{d_max}.npz")
+    if os.path.exists(filename):
+        with np.load(filename) as tables:
+            return tables["cells"], tables["rays"], tables["rows"]
+    cells, rays, rows = build(L, lane, grid, d_max)
+    os.makedirs(cache, exist_ok=True)
+    # Write then rename, so that concurrent workers never read a partial file
+    temporary = f"{filename[:-4]}.{os.getpid()}.npz"
+    np.savez(temporary, cells=cells, rays=rays, rows=rows)
+    os.replace(temporary, filename)
+    return cells, rays, rows
+
+
+def build(L: float, lane: float, grid: float, d_max: float) -> tuple:
+    """Precompute the fan of rays from every origin row to the border of the field of view.
+
+    The grid is the one of params, rolled as in shadowcasting so that the origin is always in
+    the middle column. The field of view is bounded by the walls (first and last rows) and by
+    the temporary walls one cell behind the origin and one cell past the horizon. One ray is
+    traced to the center of every cell of the field of view, so that, as in symmetric
+    shadowcasting, a cell is visible if the segment between the two centers is unobstructed.
+
+    Args:
+        L (float): road length in meters
+        lane (float): half width of the road in meters
+        grid (float): grid size in meters
+        d_max (float): horizon distance
+
+    Returns:
+        tuple: the cells (y, x) of all the rays in walking order, the offsets of each ray in
+        cells and the offsets of the rays of each origin row in rays
+    """
+    height = len(np.arange(-lane - grid / 2, lane + grid, grid))
+    width = len(np.arange(-L / 2 + grid / 2, L / 2, grid))
+    ox = width // 2
+    x_lo = int(-1 + (L / 2) / grid)
+    x_hi = min(int(1 + (L / 2 + d_max) / grid), width - 1)
+    targets = [(y, x) for y in range(height) for x in range(x_lo, x_hi + 1)]
+    cells = []
+    rays = [0]
+    rows = np.zeros(height + 1, dtype=np.int64)
+    for oy in range(height):
+        if 0 < oy < height - 1:
+            for ty, tx in targets:
+                if (ty, tx) != (oy, ox):
+                    cells.extend(line(oy, ox, ty, tx))
+                    rays.append(len(cells))
+        rows[oy + 1] = len(rays) - 1
+    cells = np.array(cells, dtype=np.int16).reshape(-1, 2)
+    return cells, np.array(rays, dtype=np.int64), rows
+
+
+def line(y0: int, x0: int, y1: int, x1: int) -> list:
+    """Cells crossed by the segment between two cell centers, without the first one.
+
+    Args:
+        y0 (int): row of the origin
+        x0 (int): column of the origin
+        y1 (int): row of the target
+        x1 (int): column of the target
+
+    Returns:
+        list: the cells (y, x) from the origin (excluded) to the target (included)
+    """
+    steps = max(abs(y1 - y0), abs(x1 - x0))
+    return [(y0 + round((y1 - y0) * k / steps), x0 + round((x1 - x0) * k / steps)) for k in range(1, steps + 1)]
+
+
+@jit(nopython=True)
+def cast(
+    top: np.ndarray,
+    prev: np.ndarray,
+    ID: int,
+    origin: tuple,
+    cells: np.ndarray,
+    rays: np.ndarray,
+    rows: np.ndarray,
+) -> np.ndarray:
+    """Walks the ray templates of an origin over the label raster until they hit something.
+
+    Args:
+        top (np.ndarray): label raster (see Raster)
+        prev (np.ndarray): labels under the cells labelled ID (see Raster)
+        ID (int): ID of the ego agent
+        origin (tuple): position on the grid
+        cells (np.ndarray): cells of the rays (see build)
+        rays (np.ndarray): offsets of each ray in cells
+        rows (np.ndarray): offsets of the rays of each origin row in rays
+
+    Returns:
+        np.ndarray: sorted unique IDs of the visible agents
+    """
+    height, width = top.shape
+    oy = origin[0]
+    roll = int(width / 2 - origin[1])
+    labels = np.empty(rows[oy + 1] - rows[oy], dtype=top.dtype)
+    k = 0
+    for ray in range(rows[oy], rows[oy + 1]):
+        for c in range(rays[ray], rays[ray + 1]):
+            y = cells[c, 0]
+            x = (cells[c, 1] - roll) % width
+            label = top[y, x]
+            if label == ID:
+                label = prev[y, x]
+            if label != 0:
+                # The outer rows are walls
+                if 0 < y < height - 1 and label > 0:
+                    labels[k] = label
+                    k += 1
+                break
+    return np.unique(labels[:k])
@@ -1,5 +1,6 @@
 from copy import deepcopy
-from math import cos, inf, isinf, pi, radians, sin
+from functools import partial
+from math import cos, inf, isinf, isnan, pi, radians, sin
 from typing import Callable
 
 import numpy as np
@@ -8,12 +9,14 @@ from numba import jit
 from numpy.linalg import norm
 
 from pNeuma_simulator import params
-from pNeuma_simulator.contact_distance import ellipses
-from pNeuma_simulator.gang import navigate
-from pNeuma_simulator.gang.neighborhood import neighborhood
+from pNeuma_simulator.contact_distance import EXACT, contact_table, ellipses, ellipses_lookup
+from pNeuma_simulator.gang import CellList, Geometry, SharedPool, Swarm, contact, navigate, navigate_many, roots
+from pNeuma_simulator.gang.neighborhood import indexed_neighborhood, neighborhood
 from pNeuma_simulator.initialization import PoissonDisc, equilibrium, ov
-from pNeuma_simulator.shadowcasting import shadowcasting
-from pNeuma_simulator.utils import direction, projection, tangent_dist
+from pNeuma_simulator.recorder import Recorder
+from pNeuma_simulator.results import ColumnarWriter, MemmapOutput
+from pNeuma_simulator.shadowcasting import Raster, cast, horizon, occlusion, shadowcasting, templates
+from pNeuma_simulator.utils import direction, ghosts, projection, tangent_dist
 
 
 def main(
@@ -24,6 +27,8 @@ def main(
     COUNT: int = 500,
     distributed: bool = True,
     stochastic: bool = True,
+    contact: str = "exact",
+    recorder: Recorder | None = None,
 ):
     """
     Simulates the main loop of a pNeuma simulator.
@@ -36,12 +41,17 @@ def main(
         COUNT (int, optional): Number of iterations in the main loop. Defaults to 500.
         distributed (bool, optional): Flag indicating if the simulation is distributed. Defaults to True.
         stochastic (bool, optional): Flag indicating if the simulation is stochastic. Defaults to True.
+        contact (str, optional): Either "exact" (root of the quartic) or "table" (interpolation of the cached
+            table, see contact_table) contact distances. Defaults to "exact".
+        recorder (Recorder, optional): Recorder of COUNT - 1 frames to write the trajectories into, e.g. a slice
+            of a MemmapOutput. It is also filled up to a collision. Defaults to None.
 
     Returns:
-        Tuple: A tuple containing the list of serialized agents at each iteration and an empty list.
+        Tuple: A tuple containing the recorded trajectories (see Recorder) and an empty list.
     """
-    # Code implementation...
-
+    if contact not in ("exact", "table"):
+        raise ValueError(f"Unknown contact: {contact}")
+    table = contact_table() if contact == "table" else EXACT
     rng = np.random.default_rng(seed)
     ###############################################
     # Main loop
@@ -55,7 +65,6 @@ def main(
     agents = samples[: 2 * n_cars]
     if n_moto > 0:
         agents.extend(rng.choice(samples[2 * n_cars :], n_moto, replace=False))
-    l_agents = []
     tau, lam, v0, s0 = equilibrium(
         params.L,
         params.lanes,
@@ -64,6 +73,9 @@ def main(
         rng,
         distributed=distributed,
     )
+    if recorder is None:
+        recorder = Recorder(COUNT - 1, len(agents))
+    recorder.statics(lam, v0, s0, [agent.mode == "Moto" for agent in agents])
     l_a = []
     l_b = []
     l_A = np.repeat(params.A, len(agents))
@@ -84,7 +96,6 @@ def main(
         # Periodic boundary
         ######################
         images = []
-        serial_agents = []
         for agent in agents:
             if agent.x < -(params.L / 2 - (params.d_max + agent.l)):
                 image = deepcopy(agent)
@@ -96,11 +107,13 @@ def main(
                 image.x -= params.L
                 images.append(image)
                 agent.image = image
-            serial_agent = deepcopy(agent)
-            serial_agent.pos = serial_agent.pos.tolist()
-            serial_agent.vel = serial_agent.vel.tolist()
-            serial_agents.append(serial_agent.encode(t))
-        l_agents.append(serial_agents)
+        recorder.record(
+            t,
+            np.array([agent.pos for agent in agents]),
+            np.array([agent.speed for agent in agents]),
+            np.array([agent.theta for agent in agents]),
+            np.array([np.nan if agent.ttc is None else agent.ttc for agent in agents]),
+        )
         ##############################
         # Field of View analysis
         ##############################
@@ -140,7 +153,7 @@ def main(
             if len(interactions) > 0:
                 navigators.append(agent)
         if len(navigators) > 0:
-            tuples = parallel(delayed(navigate)(navigator, agents) for navigator in navigators)
+            tuples = parallel(delayed(navigate)(navigator, agents, table) for navigator in navigators)
             for n, agent in enumerate(navigators):
                 a0, f_a, ttc = tuples[n]
                 agent.ttc = ttc
@@ -201,6 +214,8 @@ def main(
                             # Distance of closest approach between i and j
                             if proj == 0:
                                 min_d = l_i + l_j
+                            elif table.size:
+                                min_d, _ = ellipses_lookup(table, l_j, l_i, x_j, y_j, x_i, y_i, theta_j, theta_i)
                             else:
                                 min_d = ellipses(
                                     l_j,
@@ -265,34 +280,321 @@ def main(
             agent.advance(params.dt, new_V[n], new_theta[n])
             agent.image = None
 
-    return (l_agents, [])
+    return (recorder, [])
+
+
+def evolve(
+    n_cars: int,
+    n_moto: int,
+    seed: int,
+    parallel: Callable,
+    COUNT: int = 500,
+    distributed: bool = True,
+    stochastic: bool = True,
+    visibility: str = "raster",
+    contact: str = "exact",
+    recorder: Recorder | None = None,
+):
+    """
+    Simulates the main loop of a pNeuma simulator on a struct-of-arrays state.
+
+    This engine produces the same trajectories as main for a given seed, but keeps every per-agent field in
+    preallocated NumPy arrays (see Swarm) so that the longitudinal update runs as whole-array operations.
+
+    Args:
+        n_cars (int): Number of cars.
+        n_moto (int): Number of motorcycles.
+        seed (int): Seed for the random number generator.
+        parallel (Callable): Callable object for parallel execution (the navigation stage runs in a compiled
+            kernel instead), or a SharedPool whose workers read the state of the swarm from shared memory.
+        COUNT (int, optional): Number of iterations in the main loop. Defaults to 500.
+        distributed (bool, optional): Flag indicating if the simulation is distributed. Defaults to True.
+        stochastic (bool, optional): Flag indicating if the simulation is stochastic. Defaults to True.
+        visibility (str, optional): Either "raster" (shadowcasting on the background grid), "analytic"
+            (occlusion of the ellipses, see occlusion) or "templates" (precomputed rays on the background
+            grid, see templates). Defaults to "raster".
+        contact (str, optional): Either "exact" or "table" contact distances (see main). Defaults to "exact".
+        recorder (Recorder, optional): Recorder to write the trajectories into (see main). Defaults to None.
+
+    Returns:
+        Tuple: A tuple containing the recorded trajectories (see Recorder) and an empty list.
+    """
+    if visibility not in ("raster", "analytic", "templates"):
+        raise ValueError(f"Unknown visibility: {visibility}")
+    if contact not in ("exact", "table"):
+        raise ValueError(f"Unknown contact: {contact}")
+    table = contact_table() if contact == "table" else EXACT
+    rng = np.random.default_rng(seed)
+    ###############################################
+    # Main loop
+    ###############################################
+    E = np.zeros((COUNT, 2 * n_cars + n_moto))
+    sampler = PoissonDisc(
+        n_cars, n_moto, cell=params.cell, L=params.L, W=params.cell * 3, k=params.k, clearance=params.clearance, rng=rng
+    )
+    # [car, car, ..., moto]
+    samples, _ = sampler.sample(rng)
+    agents = samples[: 2 * n_cars]
+    if n_moto > 0:
+        agents.extend(rng.choice(samples[2 * n_cars :], n_moto, replace=False))
+    tau, lam, v0, s0 = equilibrium(
+        params.L,
+        params.lanes,
+        n_cars,
+        n_moto,
+        rng,
+        distributed=distributed,
+    )
+    for n, agent in enumerate(agents):
+        # Reassign IDs
+        agent.ID = n + 1
+        agent.tau = tau[n]
+        agent.lam = lam[n]
+        agent.v0 = v0[n]
+        agent.s0 = s0[n]
+    swarm = Swarm(agents)
+    if isinstance(parallel, SharedPool):
+        swarm = parallel.share(swarm, contact)
+    N = len(swarm)
+    if recorder is None:
+        recorder = Recorder(COUNT - 1, N)
+    recorder.statics(lam, v0, s0, swarm.moto)
+    # Narrow-phase solves of the time to collision, those saved by the broad phase and Newton iterations
+    recorder.stats.update(triples=0, culled=0, iterations=0)
+    # Roots of the time to collision at the previous step, to warm-start the solver
+    cache = roots()
+    raster = Raster(params.xv, params.yv)
+    if visibility == "templates":
+        cells, rays, rows = templates(params.L, params.lane, params.grid, params.d_max)
+    cell_list = CellList(swarm.x, params.L, params.bucket)
+    l_A = np.repeat(params.A, N)
+    l_B = np.repeat(params.B, N)
+    for t in range(COUNT - 1):
+        recorder.record(t, swarm.pos, swarm.speed, swarm.theta, swarm.ttc)
+        ##############################
+        # Field of View analysis
+        ##############################
+        # Agents within reach of the field of view of each ego, the others skip visibility and navigation
+        cell_list.update(swarm.x)
+        candidates = [
+            cell_list.window(n, swarm.x, swarm.l, params.reach, params.d_max + params.reach) for n in range(N)
+        ]
+        watchers = [n for n in range(N) if len(candidates[n]) > 0]
+        for n in range(N):
+            swarm.interactions[n] = np.empty(0, dtype=np.int64)
+        if visibility == "analytic":
+            for n in watchers:
+                swarm.interactions[n] = occlusion(
+                    n, swarm.x, swarm.y, swarm.theta, swarm.l, swarm.w, swarm.ID, params.L, params.d_max, candidates[n]
+                )
+        else:
+            # Ghosts overlapping the background grid across the seam
+            ghost_indices, ghost_shifts = ghosts(swarm.x, swarm.l + params.grid, params.L)
+            # Rasterize the occupancy once for all the agents and ghosts
+            raster.reset()
+            origins = []
+            layers = [(n, 0.0) for n in range(N)] + list(zip(ghost_indices, ghost_shifts))
+            for n, shift in layers:
+                origin = raster.ellipse(
+                    swarm.x[n] + shift, swarm.y[n], swarm.theta[n], swarm.l[n], swarm.w[n], swarm.ID[n]
+                )
+                if len(origins) < N:
+                    origins.append(origin)
+            # Each ego sees the shared raster without its own ID, up to its horizon
+            for n in watchers:
+                if visibility == "templates":
+                    swarm.interactions[n] = cast(raster.top, raster.prev, swarm.ID[n], origins[n], cells, rays, rows)
+                else:
+                    swarm.interactions[n] = horizon(
+                        raster.top, raster.prev, swarm.ID[n], origins[n], params.grid, params.L, params.d_max
+                    )
+        ##################################################
+        # Navigation module
+        ##################################################
+        navigators = [n for n in range(N) if len(swarm.interactions[n]) > 0]
+        neighborhoods = [indexed_neighborhood(n, swarm, params.L) for n in navigators]
+        # Neighbors of all the navigators in compressed sparse row format
+        navigators = np.array(navigators, dtype=np.int64)
+        indptr = np.cumsum([0] + [len(indices) for indices, _ in neighborhoods])
+        indices = np.concatenate([np.empty(0)] + [indices for indices, _ in neighborhoods]).astype(np.int64)
+        shifts = np.concatenate([np.empty(0)] + [shifts for _, shifts in neighborhoods]).astype(float)
+        # Symmetric quantities of the interacting pairs, until the agents move
+        if swarm.geometry is None:
+            swarm.geometry = Geometry(swarm, navigators, indptr, indices, shifts, table)
+        geometry = swarm.geometry
+        if len(navigators) > 0:
+            if isinstance(parallel, SharedPool):
+                a0, _, ttc, counts = parallel.navigate(navigators, indptr, indices, shifts, geometry)
+            else:
+                a0, _, ttc, counts = navigate_many(
+                    swarm.x,
+                    swarm.y,
+                    swarm.vx,
+                    swarm.vy,
+                    swarm.theta,
+                    swarm.speed,
+                    swarm.l,
+                    swarm.w,
+                    swarm.v0,
+                    swarm.moto,
+                    navigators,
+                    indptr,
+                    indices,
+                    shifts,
+                    geometry.pair,
+                    geometry.contact,
+                    geometry.dcontact,
+                    table,
+                    cache,
+                )
+            swarm.ttc[navigators] = ttc
+            recorder.stats["triples"] += int(counts[0])
+            recorder.stats["culled"] += int(counts[1])
+            recorder.stats["iterations"] += int(counts[2])
+            motos = swarm.moto[navigators]
+            swarm.a0[navigators[motos]] = a0[motos]
+        ################################
+        # Longitudinal dynamics
+        ################################
+        # Updated direction of i
+        new_theta = swarm.theta.copy()
+        new_theta[swarm.moto] = (
+            swarm.theta[swarm.moto] + params.dt * (swarm.a0[swarm.moto] - swarm.theta[swarm.moto]) / params.tau
+        )
+        leader, gap, _ = leaders(
+            swarm.pos,
+            swarm.theta,
+            new_theta,
+            swarm.l,
+            swarm.w,
+            swarm.ID,
+            navigators,
+            indptr,
+            indices,
+            shifts,
+            geometry.pair,
+            geometry.contact,
+            geometry.dcontact,
+            table,
+        )
+        swarm.leader[:] = leader
+        swarm.gap[:] = gap
+        collided = np.flatnonzero(swarm.gap <= 0)
+        if len(collided) > 0:
+            return tuple(swarm.pos[collided[0]])
+        # Retrieve inverse ttc
+        with np.errstate(divide="ignore"):
+            pseudottc = np.where(np.isnan(swarm.ttc), 0, -1 / swarm.ttc)
+        if stochastic:
+            dW = params.sqrtdt * rng.standard_normal(N)
+            E[t + 1] = (1 - params.dt / swarm.b) * E[t] + swarm.a * dW
+            OV = ov(swarm.gap, lam, v0, s0) + E[t + 1]
+        else:
+            OV = ov(swarm.gap, lam, v0, s0)
+        V_des = OV * (0.5 * (1 + np.tanh(l_A * (pseudottc + l_B))))
+        V = swarm.speed
+        new_V = V + ((V_des - V) / tau) * params.dt
+        new_V = np.maximum(new_V, 0)
+        ##################################
+        # Advance the simulation
+        ##################################
+        swarm.advance(params.dt, new_V, new_theta, params.L)
+
+    return (recorder, [])
 
 
-def batch(seed: int, permutation: tuple, n_jobs: int, distributed: bool = True, stochastic: bool = True):
+def batch(
+    seed: int,
+    permutation: tuple,
+    n_jobs: int,
+    distributed: bool = True,
+    stochastic: bool = True,
+    engine: str = "particles",
+    visibility: str = "raster",
+    contact: str = "exact",
+    filename: str | None = None,
+    slot: tuple | None = None,
+):
     """
     Run a batch simulation with the given seed and permutation.
 
+    With a filename, the worker writes the result itself (see ColumnarWriter) and only returns its
+    status, so that the trajectories are not sent back to the parent process. With a slot, the
+    trajectories are recorded straight into a shared memory map instead (see MemmapOutput).
+
+    The swarm engine with n_jobs > 1 starts its own SharedPool for the seed, which is meant for a single
+    large run: to run many seeds, keep n_jobs = 1 and spread the seeds over processes instead (see run.py).
+
     Args:
         seed (int): The seed for random number generation.
         permutation (tuple): A tuple containing the number of cars and motorcycles.
         n_jobs (int): Number of parallel jobs.
         distributed (bool, optional): Flag indicating if the simulation is distributed. Defaults to True.
         stochastic (bool, optional): Flag indicating if the simulation is stochastic. Defaults to True.
+        engine (str, optional): Either "particles" (main) or "swarm" (evolve). Defaults to "particles".
+        visibility (str, optional): Visibility mode of the swarm engine (see evolve). Defaults to "raster".
+        contact (str, optional): Either "exact" or "table" contact distances (see main). Defaults to "exact".
+        filename (str, optional): Path of the columnar result file of the seed. Defaults to None.
+        slot (tuple, optional): Directory of a MemmapOutput and index of the seed along its first axis.
+            Defaults to None.
 
     Returns:
-        tuple: A tuple containing the simulation results for cars and motorcycles.
+        tuple: A tuple containing the simulation results for cars and motorcycles, or the status of the
+        result written to filename or slot ("trajectories", "collision" or "none").
     """
     n_cars, n_moto = permutation
+    engines = {"particles": main, "swarm": evolve}
+    if engine not in engines:
+        raise ValueError(f"Unknown engine: {engine}")
+    recorder = None
+    if slot is not None:
+        dirname, epoch = slot
+        output = MemmapOutput(dirname)
+        recorder = output.recorder(epoch)
+    simulate = partial(engines[engine], contact=contact, recorder=recorder)
+    if engine == "swarm":
+        simulate = partial(evolve, visibility=visibility, contact=contact, recorder=recorder)
+    elif visibility != "raster":
+        raise ValueError(f"Visibility {visibility} requires the swarm engine")
 
-    with parallel_backend("loky", inner_max_num_threads=n_jobs):
-        with Parallel(n_jobs=n_jobs) as parallel:
+    if engine == "swarm" and n_jobs > 1:
+        # Workers reading the state from shared memory, persisting for the whole seed only
+        with SharedPool(n_jobs) as pool:
             try:
-                item = main(n_cars, n_moto, seed, parallel, params.COUNT, distributed, stochastic)
+                item = simulate(n_cars, n_moto, seed, pool, params.COUNT, distributed, stochastic)
             except CollisionException:
                 item = (None, None)
+    else:
+        with parallel_backend("loky", inner_max_num_threads=n_jobs):
+            with Parallel(n_jobs=n_jobs) as parallel:
+                try:
+                    item = simulate(n_cars, n_moto, seed, parallel, params.COUNT, distributed, stochastic)
+                except CollisionException:
+                    item = (None, None)
+    if slot is not None:
+        return output.write(epoch, item, recorder)
+    if filename is not None:
+        return store(item, filename)
     return item
 
 
+def store(item, filename: str) -> str:
+    """
+    Write the result of one seed to its own columnar file.
+
+    Args:
+        item (tuple): The result of the seed, as returned by batch.
+        filename (str): Path of the file.
+
+    Returns:
+        str: The status of the result.
+    """
+    # The writer renames the file once it is complete
+    with ColumnarWriter(filename) as writer:
+        writer.write(item)
+    return writer.items[-1]["status"]
+
+
 class CollisionException(Exception):
     """Raised when agents collide"""
 
@@ -349,3 +651,113 @@ def infront(e_i, pos_i, pos_j):
     # Check if neighbor is in front
     front = np.dot(e_i, e_i_j) > 0
     return front, e_i_j, s_i_j
+
+
+@jit(nopython=True)
+def leaders(
+    pos: np.ndarray,
+    theta: np.ndarray,
+    new_theta: np.ndarray,
+    lengths: np.ndarray,
+    widths: np.ndarray,
+    ID: np.ndarray,
+    navigators: np.ndarray,
+    indptr: np.ndarray,
+    indices: np.ndarray,
+    shifts: np.ndarray,
+    pair: np.ndarray,
+    contacts: np.ndarray,
+    dcontacts: np.ndarray,
+    table: np.ndarray,
+) -> tuple:
+    """
+    Leaders and gaps of all the agents in one pass over the interacting pairs.
+
+    The neighbors of the m-th navigator are indices[indptr[m]:indptr[m + 1]], mapped to their
+    nearest periodic images by the offsets along x in shifts (see navigate_many). A neighbor
+    leads if it is in front and its tangent parallel to the ego is within the scaled width of
+    the ego, and the gap is the distance between the centers minus the contact distance. The
+    contact distances of the egos keeping their heading are those of the pairs (see Geometry),
+    computed here if the navigation did not need them.
+
+    Args:
+        pos (ndarray): The positions of the agents.
+        theta (ndarray): The angles of the agents.
+        new_theta (ndarray): The updated angles of the agents, for the egos.
+        lengths (ndarray): The half lengths of the agents.
+        widths (ndarray): The half widths of the agents.
+        ID (ndarray): The IDs of the agents.
+        navigators (ndarray): Positional indices of the agents with interactions.
+        indptr (ndarray): Offsets of the neighbors of each navigator.
+        indices (ndarray): Positional indices of the neighbors.
+        shifts (ndarray): Offsets along x of the neighbors.
+        pair (ndarray): Unordered pairs of the neighbors, aligned with indices (see Geometry).
+        contacts (ndarray): Contact distances of the pairs at the current headings (NaN if not
+            computed yet), filled in place.
+        dcontacts (ndarray): Their derivatives with respect to the angle of the line joining the
+            centers, filled in place.
+        table (ndarray): Tabulated contact distances (see contact_table), or EXACT.
+
+    Returns:
+        tuple: IDs of the leaders (0 if none), gaps (to the leader, or else to the wall ahead, at
+        most d_max) and gaps to the walls (inf if heading along the road), one per agent.
+    """
+    N = len(pos)
+    leader = np.zeros(N, dtype=np.int64)
+    gap = np.empty(N)
+    gap_w = np.empty(N)
+    rows = np.full(N, -1)
+    for m in range(len(navigators)):
+        rows[navigators[m]] = m
+    for n in range(N):
+        theta_i = new_theta[n]
+        l_i, w_i = lengths[n], widths[n]
+        pos_i = pos[n]
+        x_i, y_i = pos_i[0], pos_i[1]
+        # Distance from walls
+        k_w = tangent_dist(theta_i, 0, l_i, w_i)
+        if theta_i >= radians(params.da):
+            gap_w[n] = (params.lane - y_i - k_w) / sin(theta_i)
+        elif theta_i <= -radians(params.da):
+            gap_w[n] = (params.lane + y_i - k_w) / sin(-theta_i)
+        else:
+            gap_w[n] = inf
+        gap[n] = inf
+        m = rows[n]
+        if m >= 0:
+            # Direction vector and its normal
+            e_i, e_i_n = direction(theta_i)
+            for p in range(indptr[m], indptr[m + 1]):
+                j = indices[p]
+                l_j, w_j = lengths[j], widths[j]
+                pos_j = pos[j].copy()
+                pos_j[0] += shifts[p]
+                x_j, y_j = pos_j[0], pos_j[1]
+                theta_j = theta[j]
+                # Check if neighbor is in front
+                front, e_i_j, s_i_j = infront(e_i, pos_i, pos_j)
+                if front:
+                    # Distance from tangent parallel to i
+                    k_h = tangent_dist(theta_j, theta_i, l_j, w_j)
+                    proj = projection(e_i_n, e_i_j, s_i_j)
+                    if proj <= params.scaling * w_i + k_h:
+                        # Distance of closest approach between i and j
+                        if proj == 0:
+                            min_d = l_i + l_j
+                        elif theta_i == theta[n]:
+                            q = pair[p]
+                            if isnan(contacts[q]):
+                                contacts[q], dcontacts[q] = contact(
+                                    table, l_j, w_j, l_i, w_i, x_j, y_j, x_i, y_i, theta_j, theta_i
+                                )
+                            min_d = contacts[q]
+                        elif table.size:
+                            min_d, _ = ellipses_lookup(table, l_j, l_i, x_j, y_j, x_i, y_i, theta_j, theta_i)
+                        else:
+                            min_d = ellipses(l_j, w_j, l_i, w_i, x_j, y_j, x_i, y_i, theta_j, theta_i)
+                        if s_i_j - min_d < gap[n]:
+                            gap[n] = s_i_j - min_d
+                            leader[n] = ID[j]
+        if isinf(gap[n]):
+            gap[n] = min(gap_w[n], params.d_max)
+    return leader, gap, gap_w
@@ -1 +1 @@
-from .utils import direction, projection, tangent_dist, truncated_rvs  # noqa F401
+from .utils import direction, ghosts, periodic_shift, projection, tangent_dist, truncated_rvs  # noqa F401
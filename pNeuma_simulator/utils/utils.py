@@ -66,6 +66,59 @@ def tangent_dist(theta_i: float, theta_j: float, a_i: float, b_i: float) -> floa
     return k_prime
 
 
+@jit(nopython=True)
+def periodic_shift(x_i: float, x_j: float, L: float) -> float:
+    """
+    Calculate the offset along x of the periodic image of j nearest to i (minimum-image convention).
+
+    Args:
+        x_i (float): The x-coordinate of i.
+        x_j (float): The x-coordinate of j.
+        L (float): The road length.
+
+    Returns:
+        shift (float): The offset (0 or +/-L) to add to x_j.
+    """
+    if x_j - x_i > L / 2:
+        shift = -L
+    elif x_j - x_i < -L / 2:
+        shift = L
+    else:
+        shift = 0.0
+    return shift
+
+
+@jit(nopython=True)
+def ghosts(x: np.ndarray, reach: np.ndarray, L: float) -> tuple:
+    """
+    Find the periodic images (ghosts) of the agents lying within reach of the seam at +/-L/2.
+
+    Ghosts are represented by the index of the original agent and an offset along x,
+    so that no object has to be cloned.
+
+    Args:
+        x (ndarray): The x-coordinates of the agents.
+        reach (ndarray): The distance from the seam below which an agent has a ghost.
+        L (float): The road length.
+
+    Returns:
+        tuple: A tuple containing the indices of the agents with a ghost and the corresponding offsets.
+    """
+    indices = np.empty(len(x), dtype=np.int64)
+    shifts = np.empty(len(x))
+    k = 0
+    for n in range(len(x)):
+        if x[n] < -(L / 2 - reach[n]):
+            indices[k] = n
+            shifts[k] = L
+            k += 1
+        elif x[n] > L / 2 - reach[n]:
+            indices[k] = n
+            shifts[k] = -L
+            k += 1
+    return indices[:k], shifts[:k]
+
+
 def truncated_rvs(
     rng,
     size: int,
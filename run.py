@@ -3,15 +3,15 @@ import itertools
 import json
 import os
 import warnings
-import zipfile
+from concurrent.futures import as_completed
 
 import numpy as np
-from joblib import Parallel, delayed
 from joblib.externals.loky import get_reusable_executor
 from numpy import arange
 from tqdm.notebook import tqdm
 
-from pNeuma_simulator.results import zipdir
+from pNeuma_simulator import params
+from pNeuma_simulator.results import ColumnarWriter, MemmapOutput, columnar_loader
 from pNeuma_simulator.simulate import batch
 
 warnings.filterwarnings("ignore")
@@ -24,39 +24,187 @@ scale = 2
 l_cars = scale * arange(1, n_veh, 1)
 l_moto = scale * arange(0, n_veh - 1, 1)
 permutations = list(itertools.product(l_cars, l_moto))
+# Thread pools capped in the workers
+THREADS = (
+    "NUMBA_NUM_THREADS",
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "BLIS_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+)
 
 
-def execute(n_cars, n_moto, epochs=64, n_jobs=64, n_threads=1, distributed=True, stochastic=True, save=True):
+def execute(
+    n_cars,
+    n_moto,
+    epochs=64,
+    n_jobs=64,
+    n_threads=1,
+    distributed=True,
+    stochastic=True,
+    save=True,
+    memmap=False,
+    **options,
+):
     name = (n_cars, n_moto)
-    default_rng = np.random.default_rng(1024)
-    seeds = default_rng.integers(1e8, size=epochs * len(permutations))
     for n, permutation in tqdm(enumerate(permutations)):
-        start = n * epochs
-        end = (n + 1) * epochs
         if permutation == name:
-            # https://stackoverflow.com/questions/67891651/
-            with Parallel(n_jobs=n_jobs) as parallel:
-                items = parallel(
-                    delayed(batch)(seed, permutation, n_threads, distributed, stochastic) for seed in seeds[start:end]
-                )
-            # https://stackoverflow.com/questions/67495271/
-            get_reusable_executor().shutdown(wait=True)
-            if save:
-                # Dump to JSONL https://jsonlines.org/examples/
-                # https://stackoverflow.com/questions/38915183/
-                with open(f"{path}{permutation}.jsonl", "w") as outfile:
-                    for item in items:
-                        json.dump(item, outfile)
-                        outfile.write("\n")
-                # Compress as Zip and delete original JSONL
-                filename = f"{path}{permutation}_r.zip"
-                if distributed and not stochastic:
-                    filename = f"{path}{permutation}_het_det.zip"
-                elif not distributed and not stochastic:
-                    filename = f"{path}{permutation}_hom_det.zip"
-                with zipfile.ZipFile(filename, "w", zipfile.ZIP_DEFLATED) as zipf:
-                    zipdir(path, permutation, zipf)
-            print(permutation)
+            schedule([n], epochs, n_jobs, n_threads, distributed, stochastic, save, memmap, **options)
+
+
+def sweep(epochs=64, n_jobs=64, n_threads=1, distributed=True, stochastic=True, save=True, memmap=False, **options):
+    """Run all the permutations as a single queue of (permutation, seed) tasks.
+
+    The workers pick the next task as soon as they are done, whatever its permutation, so that
+    no core waits for the last seeds of a permutation. The largest permutations are queued
+    first to shorten the tail. The seeds are those of execute, and the options (engine, visibility,
+    contact) are passed on to batch.
+    """
+    # Number of agents of each permutation
+    order = sorted(range(len(permutations)), key=lambda n: -(2 * permutations[n][0] + permutations[n][1]))
+    schedule(order, epochs, n_jobs, n_threads, distributed, stochastic, save, memmap, **options)
+
+
+def schedule(indices, epochs, n_jobs, n_threads, distributed, stochastic, save, memmap=False, **options):
+    """Run the seeds of the given permutations in one pool of workers.
+
+    Each worker writes the record of its seed itself (see batch) and only sends back its status, so
+    that the trajectories never go through the parent. The record is added to the manifest of its
+    permutation as soon as it completes (see persist), and the tasks already there are skipped, so
+    that a job restarted with the same arguments resumes where it died. The archive of a permutation is
+    assembled once all its seeds are done.
+
+    With memmap, the seeds of each permutation are recorded instead into one preallocated memory map
+    (see MemmapOutput), whose status array replaces the manifest and the archive.
+
+    The options (engine, visibility, contact) are passed on to batch, see its arguments.
+    """
+    seeds = draw(epochs)
+    if save and not memmap:
+        os.makedirs(f"{path}seeds/", exist_ok=True)
+    # Cap the thread pools of each worker as joblib does, numba would otherwise start one thread per core
+    env = {name: str(n_threads) for name in THREADS}
+    executor = get_reusable_executor(max_workers=n_jobs, env=env)
+    futures = {}
+    pending = {}
+    for n in indices:
+        permutation = tuple(int(i) for i in permutations[n])
+        pending[n] = 0
+        slots = [None] * epochs
+        done = set()
+        if save and memmap:
+            dirname = stem(permutation, distributed, stochastic)
+            n_cars, n_moto = permutation
+            output = MemmapOutput(dirname, (epochs, params.COUNT - 1, 2 * n_cars + n_moto))
+            slots = [(dirname, epoch) for epoch in range(epochs)]
+            done = {int(seeds[n * epochs + epoch]) for epoch in output.done()}
+        elif save:
+            done = finished(permutation, distributed, stochastic)
+        for seed, slot in zip(seeds[n * epochs : (n + 1) * epochs], slots):
+            if int(seed) in done:
+                continue
+            filename = record(permutation, seed, distributed, stochastic) if save and not memmap else None
+            args = (seed, permutation, n_threads, distributed, stochastic)
+            future = executor.submit(batch, *args, filename=filename, slot=slot, **options)
+            futures[future] = (n, int(seed))
+            pending[n] += 1
+    for n in indices:
+        if pending[n] == 0:
+            complete(n, seeds, epochs, distributed, stochastic, save and not memmap)
+    for future in tqdm(as_completed(futures), total=len(futures)):
+        n, seed = futures.pop(future)
+        # Raise the errors of the worker
+        future.result()
+        if save and not memmap:
+            persist(permutations[n], seed, distributed, stochastic)
+        pending[n] -= 1
+        if pending[n] == 0:
+            complete(n, seeds, epochs, distributed, stochastic, save and not memmap)
+    # https://stackoverflow.com/questions/67495271/
+    executor.shutdown(wait=True)
+
+
+def complete(n, seeds, epochs, distributed, stochastic, save):
+    """Assemble the archive of a permutation whose seeds are all done."""
+    permutation = permutations[n]
+    if save:
+        archive(permutation, seeds[n * epochs : (n + 1) * epochs], distributed, stochastic)
+    print(permutation)
+
+
+def draw(epochs):
+    """Seeds of all the permutations, epochs consecutive seeds per permutation."""
+    default_rng = np.random.default_rng(1024)
+    return default_rng.integers(1e8, size=epochs * len(permutations))
+
+
+def record(permutation, seed, distributed, stochastic):
+    """Path of the result of one task, keyed by (permutation, seed, distributed, stochastic)."""
+    n_cars, n_moto = permutation
+    return f"{path}seeds/{n_cars}_{n_moto}_{seed}_{int(distributed)}{int(stochastic)}.pneuma"
+
+
+def manifest(permutation, distributed, stochastic):
+    """Path of the manifest of a permutation, so that concurrent jobs never share one."""
+    return f"{stem(permutation, distributed, stochastic)}.manifest.jsonl"
+
+
+def persist(permutation, seed, distributed, stochastic):
+    """Add a task whose record has been written to the manifest of its permutation."""
+    task = {
+        "permutation": [int(i) for i in permutation],
+        "seed": int(seed),
+        "distributed": distributed,
+        "stochastic": stochastic,
+    }
+    with open(manifest(permutation, distributed, stochastic), "a") as outfile:
+        outfile.write(json.dumps(task) + "\n")
+        outfile.flush()
+        os.fsync(outfile.fileno())
+
+
+def finished(permutation, distributed, stochastic):
+    """Seeds of the manifest of a permutation with an existing record."""
+    done = set()
+    filename = manifest(permutation, distributed, stochastic)
+    if not os.path.exists(filename):
+        return done
+    with open(filename, "r+") as infile:
+        lines = infile.read().split("\n")
+        # Drop the torn line of a job killed while writing, before appending to the manifest
+        if lines[-1]:
+            infile.truncate(infile.tell() - len(lines[-1].encode()))
+        for line in lines[:-1]:
+            seed = json.loads(line)["seed"]
+            if os.path.exists(record(permutation, seed, distributed, stochastic)):
+                done.add(seed)
+    return done
+
+
+def stem(permutation, distributed=True, stochastic=True):
+    """Path of the results of a permutation, without extension."""
+    if distributed and not stochastic:
+        return f"{path}{permutation}_het_det"
+    elif not distributed and not stochastic:
+        return f"{path}{permutation}_hom_det"
+    return f"{path}{permutation}_r"
+
+
+def archive(permutation, seeds, distributed=True, stochastic=True):
+    """Assemble the records of the seeds of a permutation into a columnar result file."""
+    filename = f"{stem(permutation, distributed, stochastic)}.pneuma"
+    meta = {
+        "permutation": [int(i) for i in permutation],
+        "seeds": [int(seed) for seed in seeds],
+        "distributed": distributed,
+        "stochastic": stochastic,
+    }
+    with ColumnarWriter(filename, meta=meta) as writer:
+        for seed in seeds:
+            for item in columnar_loader(record(permutation, seed, distributed, stochastic)):
+                writer.write(item)
 
 
 if __name__ == "__main__":
@@ -67,18 +215,32 @@ if __name__ == "__main__":
     parser.add_argument("--distributed", action="store_false", help="heterogeneity")
     parser.add_argument("--stochastic", action="store_false", help="stochasticity")
     parser.add_argument("--save", action="store_false", help="write to file")
-    parser.add_argument("n_cars", help="Number of cars per lane")
-    parser.add_argument("n_moto", help="Total number of motorcycles")
+    parser.add_argument("--sweep", action="store_true", help="run all the permutations in one work queue")
+    parser.add_argument("--memmap", action="store_true", help="record each permutation into one shared memory map")
+    parser.add_argument("--engine", default="particles", choices=("particles", "swarm"), help="simulation engine")
+    parser.add_argument(
+        "--visibility", default="raster", choices=("raster", "analytic", "templates"), help="visibility of the swarm"
+    )
+    parser.add_argument("--contact", default="exact", choices=("exact", "table"), help="contact distances")
+    parser.add_argument("n_cars", nargs="?", help="Number of cars per lane")
+    parser.add_argument("n_moto", nargs="?", help="Total number of motorcycles")
     args = parser.parse_args()
+    if not args.sweep and (args.n_cars is None or args.n_moto is None):
+        parser.error("n_cars and n_moto are required without --sweep")
     config = vars(args)
-    n_cars = int(config["n_cars"])
-    n_moto = int(config["n_moto"])
     epochs = int(config["epochs"])
     n_jobs = int(config["n_jobs"])
     n_threads = int(config["n_threads"])
     distributed = config["distributed"]
     stochastic = config["stochastic"]
     save = config["save"]
+    memmap = config["memmap"]
+    options = {key: config[key] for key in ("engine", "visibility", "contact")}
     print(config)
-    execute(n_cars, n_moto, epochs, n_jobs, n_threads, distributed, stochastic, save)
+    if config["sweep"]:
+        sweep(epochs, n_jobs, n_threads, distributed, stochastic, save, memmap, **options)
+    else:
+        n_cars = int(config["n_cars"])
+        n_moto = int(config["n_moto"])
+        execute(n_cars, n_moto, epochs, n_jobs, n_threads, distributed, stochastic, save, memmap, **options)
     print("Done!")
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from pNeuma_simulator import params
+from pNeuma_simulator.gang import CellList
+
+
+def brute_force(n, x, lengths, behind, ahead, L):
+    """Agents overlapping the window of an ego, checking every agent and its periodic images."""
+    found = []
+    for j in range(len(x)):
+        if j == n:
+            continue
+        dx = (x[j] - x[n] + L / 2) % L - L / 2
+        if any(image + lengths[j] > -behind and image - lengths[j] < ahead for image in (dx - L, dx, dx + L)):
+            found.append(j)
+    return found
+
+
+@pytest.mark.parametrize("size", [params.bucket, 5.0, 200.0])
+def test_window(size):
+    """The window of every ego matches the brute force, as the agents move across the buckets."""
+    rng = np.random.default_rng(0)
+    L = params.L
+    N = 30
+    x = rng.uniform(-L / 2, L / 2, N)
+    lengths = rng.uniform(0.8, 2.5, N)
+    cells = CellList(x, L, size)
+    for _ in range(20):
+        x = (x + rng.uniform(0, 15, N) + L / 2) % L - L / 2
+        cells.update(x)
+        for n in range(N):
+            found = cells.window(n, x, lengths, params.reach, params.d_max + params.reach)
+            assert found.tolist() == brute_force(n, x, lengths, params.reach, params.d_max + params.reach, L)
+
+
+def test_update():
+    """Each bucket links exactly the agents located in it."""
+    rng = np.random.default_rng(1)
+    L = params.L
+    x = rng.uniform(-L / 2, L / 2, 50)
+    cells = CellList(x, L, params.bucket)
+    before = cells.cell.copy()
+    x = (x + rng.uniform(-10, 10, 50) + L / 2) % L - L / 2
+    moved = cells.update(x)
+    expected = np.floor((x + L / 2) / cells.width).astype(int) % cells.n_cells
+    assert moved == np.count_nonzero(expected != before)
+    np.testing.assert_array_equal(cells.cell, expected)
+    for c in range(cells.n_cells):
+        members = []
+        j = cells.head[c]
+        while j >= 0:
+            members.append(j)
+            j = cells.successor[j]
+        assert sorted(members) == np.flatnonzero(expected == c).tolist()
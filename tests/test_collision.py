@@ -0,0 +1,149 @@
+from math import cos, sin
+
+import numpy as np
+import pytest
+
+from pNeuma_simulator import params
+from pNeuma_simulator.contact_distance import EXACT
+from pNeuma_simulator.gang.collision import newton_iteration, solve, solve_many
+
+TOLERANCE = 1e-3
+
+
+def following(rng):
+    """A pair following each other in the same lane, the follower i being faster than the leader j."""
+    l_i, w_i = rng.uniform([1, 0.3], [2.5, 1])
+    l_j, w_j = rng.uniform([1, 0.3], [2.5, 1])
+    y = rng.uniform(-2, 2)
+    x_j = l_i + l_j + rng.uniform(0.5, 30)
+    v_i = rng.uniform(1, 15)
+    # Closing at 0.1 m/s at least, beyond which the finite difference of newton_iteration is too coarse
+    v_j = rng.uniform(0, v_i - 0.1)
+    return l_j, w_j, l_i, w_i, x_j, y, 0.0, y, 0.0, 0.0, v_j, 0.0, v_i, 0.0
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_solve_following(seed):
+    """solve converges wherever newton_iteration does, to the same time to collision."""
+    rng = np.random.default_rng(seed)
+    for _ in range(500):
+        args = following(rng)
+        ref, _ = newton_iteration(*args, tolerance=TOLERANCE)
+        ttc, _, converged = solve(*args, EXACT, tolerance=TOLERANCE)
+        assert converged
+        assert ref is not None
+        assert ttc == pytest.approx(ref, abs=TOLERANCE)
+
+
+def test_solve_diverging():
+    """A faster leader is never reached."""
+    ttc, _, converged = solve(2.0, 0.8, 2.0, 0.8, 10.0, 0.0, 0.0, 0.0, 0.0, 0.0, 12.0, 0.0, 8.0, 0.0, EXACT)
+    assert converged
+    assert np.isnan(ttc)
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_solve_warm_start(seed):
+    """Warm starts from the root of the previous step give the cold time to collision."""
+    rng = np.random.default_rng(seed)
+    dt = params.dt
+    for _ in range(500):
+        l_j, w_j, l_i, w_i, x_j, y_j, x_i, y_i, _, _, v_j, _, v_i, _ = following(rng)
+        y_j += rng.uniform(-1, 1)
+        # Previous step, then the headings and speeds change
+        before = rng.uniform(-0.1, 0.1, 2)
+        after = before + rng.uniform(-0.1, 0.1, 2)
+        speeds = np.array([v_j, v_i]) * rng.uniform(0.8, 1.2, 2)
+        ttc, _, _ = solve(*pair(l_j, w_j, l_i, w_i, x_j, y_j, x_i, y_i, before, [v_j, v_i]), EXACT)
+        x_j += v_j * cos(before[0]) * dt
+        y_j += v_j * sin(before[0]) * dt
+        x_i += v_i * cos(before[1]) * dt
+        y_i += v_i * sin(before[1]) * dt
+        args = pair(l_j, w_j, l_i, w_i, x_j, y_j, x_i, y_i, after, speeds)
+        cold, _, _ = solve(*args, EXACT, tolerance=TOLERANCE)
+        warm, _, _ = solve(*args, EXACT, tolerance=TOLERANCE, seed=ttc - dt)
+        assert np.isnan(warm) == np.isnan(cold)
+        if not np.isnan(cold):
+            assert warm == pytest.approx(cold, abs=TOLERANCE)
+
+
+def pair(l_j, w_j, l_i, w_i, x_j, y_j, x_i, y_i, thetas, speeds):
+    """Arguments of solve for two agents moving along their headings."""
+    theta_j, theta_i = thetas
+    v_j, v_i = speeds
+    return (
+        l_j,
+        w_j,
+        l_i,
+        w_i,
+        x_j,
+        y_j,
+        x_i,
+        y_i,
+        theta_j,
+        theta_i,
+        v_j * cos(theta_j),
+        v_j * sin(theta_j),
+        v_i * cos(theta_i),
+        v_i * sin(theta_i),
+    )
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_solve_many(seed):
+    """The batch gives the times to collision of solve, and only culls the pairs that never collide."""
+    rng = np.random.default_rng(seed)
+    n = 12
+    x, y = rng.uniform([-20, -3], [20, 3], (n, 2)).T
+    thetas = rng.uniform(-0.3, 0.3, n)
+    speeds = rng.uniform(0, 15, n)
+    vx, vy = speeds * np.cos(thetas), speeds * np.sin(thetas)
+    lengths, widths = rng.uniform([1, 0.3], [2.5, 1], (n, 2)).T
+    egos, others = np.array([(i, j) for i in range(n) for j in range(n) if i != j]).T
+    m = len(egos)
+    # The ego may turn, the neighbor keeps its velocity
+    headings = thetas[egos] + rng.uniform(-0.2, 0.2, m)
+    ttc, _, converged, culled = solve_many(
+        x,
+        y,
+        vx,
+        vy,
+        thetas,
+        lengths,
+        widths,
+        egos,
+        others,
+        np.zeros(m),
+        speeds[egos],
+        headings,
+        np.full(m, np.inf),
+        np.full(m, np.nan),
+        np.full(m, -1),
+        np.empty(0),
+        np.empty(0),
+        EXACT,
+    )
+    assert converged.all()
+    for k, (i, j) in enumerate(zip(egos, others)):
+        v_i = speeds[i]
+        ref, _, _ = solve(
+            lengths[j],
+            widths[j],
+            lengths[i],
+            widths[i],
+            x[j],
+            y[j],
+            x[i],
+            y[i],
+            thetas[j],
+            headings[k],
+            vx[j],
+            vy[j],
+            v_i * cos(headings[k]),
+            v_i * sin(headings[k]),
+            EXACT,
+        )
+        if culled[k]:
+            assert np.isnan(ttc[k]) and np.isnan(ref)
+        else:
+            np.testing.assert_equal(ttc[k], ref)
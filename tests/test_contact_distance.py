@@ -0,0 +1,91 @@
+from math import pi
+
+import numpy as np
+import pytest
+
+from pNeuma_simulator import params
+from pNeuma_simulator.contact_distance import (
+    contact_table,
+    ellipses,
+    ellipses_derivative,
+    ellipses_lookup,
+    ellipses_many,
+    quartic,
+)
+
+SHAPES = ((params.car_l, params.car_w), (params.moto_l, params.moto_w))
+
+
+def configurations(rng, m):
+    """Random pairs of ellipses, the second one apart from the first in any direction."""
+    a1, a2 = rng.uniform(0.5, 3, (2, m))
+    b1 = a1 * rng.uniform(0.1, 1, m)
+    b2 = a2 * rng.uniform(0.1, 1, m)
+    bearing = rng.uniform(-pi, pi, m)
+    distance = rng.uniform(0, 10, m)
+    x2, y2 = distance * np.cos(bearing), distance * np.sin(bearing)
+    theta1, theta2 = rng.uniform(-pi, pi, (2, m))
+    return a1, b1, a2, b2, np.zeros(m), np.zeros(m), x2, y2, theta1, theta2
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_quartic(seed):
+    """quartic finds the positive root that np.roots picked in the legacy ellipses."""
+    rng = np.random.default_rng(seed)
+    for _ in range(1000):
+        # A single positive root r, the other roots have negative real parts
+        r, s = rng.uniform(0.01, 100, 2)
+        p, c = rng.uniform(0.01, 100, 2)
+        A = -rng.uniform(0.01, 100)
+        B, C, D, E = A * np.polymul(np.poly([r, -s]), [1, p, c])[1:]
+        rts = np.real(np.roots(np.array([A, B, C, D, E], dtype=np.complex128)))
+        ref = rts[rts > 0][0]
+        assert quartic(A, B, C, D, E) == pytest.approx(ref, rel=1e-9)
+
+
+def test_ellipses_closed_forms():
+    """Distances of closest approach with a closed form."""
+    # Circles
+    assert ellipses(1.5, 1.5, 0.5, 0.5, 0.0, 0.0, 3.0, 4.0, 0.3, -1.2) == pytest.approx(2.0)
+    # Along the major axes
+    assert ellipses(2.0, 0.8, 1.0, 0.3, 0.0, 0.0, 5.0, 0.0, 0.0, 0.0) == pytest.approx(3.0)
+    # Side by side
+    assert ellipses(2.0, 0.8, 1.0, 0.3, 0.0, 0.0, 0.0, 5.0, 0.0, 0.0) == pytest.approx(1.1)
+    # Major axis of the second one across the line of centers
+    assert ellipses(2.0, 0.8, 1.0, 0.3, 0.0, 0.0, 5.0, 0.0, 0.0, pi / 2) == pytest.approx(2.3)
+
+
+def test_ellipses_many():
+    """The batched distances are those of ellipses."""
+    rng = np.random.default_rng(0)
+    args = configurations(rng, 2000)
+    out = ellipses_many(*args, np.empty(2000))
+    ref = [ellipses(*pair) for pair in zip(*args)]
+    np.testing.assert_array_equal(out, ref)
+
+
+def test_ellipses_derivative():
+    """ellipses_derivative gives the distance of ellipses and its finite difference along the bearing."""
+    rng = np.random.default_rng(1)
+    h = 1e-6
+    for a1, b1, a2, b2, x1, y1, x2, y2, theta1, theta2 in zip(*configurations(rng, 500)):
+        dist, ddist = ellipses_derivative(a1, b1, a2, b2, x1, y1, x2, y2, theta1, theta2)
+        assert dist == pytest.approx(ellipses(a1, b1, a2, b2, x1, y1, x2, y2, theta1, theta2), rel=1e-12)
+        # Rotate the line of centers, not the ellipses
+        bearing, s = np.arctan2(y2 - y1, x2 - x1), np.hypot(x2 - x1, y2 - y1)
+        ahead = ellipses(a1, b1, a2, b2, x1, y1, s * np.cos(bearing + h), s * np.sin(bearing + h), theta1, theta2)
+        behind = ellipses(a1, b1, a2, b2, x1, y1, s * np.cos(bearing - h), s * np.sin(bearing - h), theta1, theta2)
+        assert ddist == pytest.approx((ahead - behind) / (2 * h), abs=1e-5 * max(a1, a2))
+
+
+def test_contact_table():
+    """The tabulated distances of the vehicle shapes are within the tolerance of ellipses."""
+    table = contact_table(cache=False)
+    rng = np.random.default_rng(2)
+    for _ in range(2000):
+        (a1, b1), (a2, b2) = SHAPES[rng.integers(2)], SHAPES[rng.integers(2)]
+        x2, y2 = rng.uniform(-10, 10, 2)
+        theta1, theta2 = rng.uniform(-pi, pi, 2)
+        dist, _ = ellipses_lookup(table, a1, a2, 0.0, 0.0, x2, y2, theta1, theta2)
+        ref = ellipses(a1, b1, a2, b2, 0.0, 0.0, x2, y2, theta1, theta2)
+        assert dist == pytest.approx(ref, abs=params.contact_tolerance)
@@ -0,0 +1,19 @@
+import numpy as np
+from joblib import Parallel
+
+from pNeuma_simulator.gang import SharedPool
+from pNeuma_simulator.simulate import evolve
+
+SEED = 8933728
+COUNT = 20
+
+
+def test_shared_pool():
+    """The pool gives the trajectories of the serial navigation, whatever the number of workers."""
+    with Parallel(n_jobs=1) as parallel:
+        ref, _ = evolve(4, 4, SEED, parallel, COUNT)
+    for n_workers in (1, 3):
+        with SharedPool(n_workers) as pool:
+            item, _ = evolve(4, 4, SEED, pool, COUNT)
+        np.testing.assert_array_equal(item.data, ref.data)
+        assert not pool.workers and not pool.blocks
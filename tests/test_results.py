@@ -0,0 +1,111 @@
+import json
+import zipfile
+
+import numpy as np
+import pytest
+
+from pNeuma_simulator import ColumnarWriter, MemmapOutput, Recorder, columnar_header, columnar_loader, convert, loader
+from pNeuma_simulator.results import decode
+
+N_CARS = 2
+
+
+def recording(rng, frames=300, n_veh=6):
+    """A recorder of smooth random trajectories, some times to collision undefined."""
+    recorder = Recorder(frames, n_veh)
+    x = rng.uniform(-45, 45, n_veh)
+    for t in range(frames):
+        speed = rng.uniform(0, 15, n_veh)
+        theta = rng.uniform(-0.3, 0.3, n_veh)
+        x = x + 0.12 * speed
+        pos = np.column_stack([x, rng.uniform(-3, 3, n_veh)])
+        ttc = np.where(rng.random(n_veh) < 0.5, np.nan, rng.uniform(0, 10, n_veh))
+        recorder.record(t, pos, speed, theta, ttc)
+    moto = np.arange(n_veh) >= 2 * N_CARS
+    recorder.statics(rng.uniform(0, 1, n_veh), rng.uniform(5, 15, n_veh), rng.uniform(1, 3, n_veh), moto)
+    return recorder
+
+
+def items(rng):
+    return [(recording(rng), []), (12.5, -1.25), (None, None), (recording(rng, frames=10), [])]
+
+
+def assert_items_equal(items, refs):
+    assert len(items) == len(refs)
+    for item, ref in zip(items, refs):
+        if isinstance(ref[0], Recorder):
+            assert item[1] == []
+            np.testing.assert_array_equal(item[0].data[: ref[0].frames], ref[0].data[: ref[0].frames])
+            for name in ("lam", "v0", "s0", "moto"):
+                np.testing.assert_array_equal(getattr(item[0], name), getattr(ref[0], name))
+        else:
+            assert tuple(item) == tuple(ref)
+
+
+@pytest.mark.parametrize("level", [0, 6])
+def test_columnar(tmp_path, level):
+    """The columnar file gives back the recorded values exactly."""
+    refs = items(np.random.default_rng(0))
+    filename = str(tmp_path / "result.pneuma")
+    with ColumnarWriter(filename, chunk=64, level=level, meta={"seeds": [1, 2, 3, 4]}) as writer:
+        for item in refs:
+            writer.write(item)
+    assert_items_equal(columnar_loader(filename), refs)
+    header = columnar_header(filename)
+    assert header["seeds"] == [1, 2, 3, 4]
+    assert [entry["status"] for entry in header["items"]] == ["trajectories", "collision", "none", "trajectories"]
+
+
+def test_columnar_f4(tmp_path):
+    """Single precision keeps the fields to about 1e-7."""
+    refs = items(np.random.default_rng(1))
+    filename = str(tmp_path / "result.pneuma")
+    with ColumnarWriter(filename, dtype="<f4") as writer:
+        for item in refs:
+            writer.write(item)
+    recorder = columnar_loader(filename)[0][0]
+    np.testing.assert_allclose(recorder.data, refs[0][0].data, rtol=1e-7)
+
+
+def test_json_loader(tmp_path):
+    """The legacy JSON archives decode to the recorded values."""
+    refs = items(np.random.default_rng(2))
+    permutation = (N_CARS, 2)
+    legacy = [[item[0].encode(), []] if isinstance(item[0], Recorder) else list(item) for item in refs]
+    with zipfile.ZipFile(tmp_path / f"{permutation}.zip", "w") as ziph:
+        ziph.writestr(f"{permutation}.json", json.dumps(legacy))
+    decoded = [decode(item, N_CARS) for item in loader(permutation, f"{tmp_path}/", verbose=False)]
+    assert_items_equal(decoded, refs)
+
+
+def test_convert(tmp_path):
+    """A JSONL archive converts to the same columnar file as the recorders."""
+    refs = items(np.random.default_rng(3))
+    archive = tmp_path / "archive.zip"
+    with zipfile.ZipFile(archive, "w") as ziph:
+        lines = [json.dumps([item[0].encode(), []] if isinstance(item[0], Recorder) else item) for item in refs]
+        ziph.writestr("(2, 2).jsonl", "\n".join(lines) + "\n")
+    filename = str(tmp_path / "result.pneuma")
+    convert(str(archive), filename, N_CARS)
+    assert_items_equal(columnar_loader(filename), refs)
+
+
+def test_memmap(tmp_path):
+    """The seeds recorded into a memory map are read back after being reopened."""
+    rng = np.random.default_rng(4)
+    dirname = str(tmp_path / "memmap")
+    output = MemmapOutput(dirname, (3, 300, 6))
+    refs = {}
+    for epoch, ref in zip((2, 0), [(recording(rng), []), (12.5, -1.25)]):
+        recorder = output.recorder(epoch)
+        item = ref
+        if isinstance(ref[0], Recorder):
+            for t in range(ref[0].frames):
+                recorder.record(t, ref[0].data[t, :, :2], *ref[0].data[t, :, 2:].T)
+            recorder.statics(ref[0].lam, ref[0].v0, ref[0].s0, ref[0].moto)
+            item = (recorder, [])
+        output.write(epoch, item, recorder)
+        refs[epoch] = ref
+    output = MemmapOutput(dirname, (3, 300, 6))
+    assert output.done().tolist() == [0, 2]
+    assert_items_equal(output.items(), [refs[0], refs[2]])
@@ -0,0 +1,148 @@
+from math import cos, pi, sin
+
+import numpy as np
+import pytest
+
+from pNeuma_simulator import params
+from pNeuma_simulator.shadowcasting import Raster, build, cast, horizon, occlusion, shadowcasting, subtend, templates
+from pNeuma_simulator.simulate import identify
+from pNeuma_simulator.utils import ghosts
+
+
+def scene(rng, N):
+    """Random cars and motorcycles on the road, with the IDs of the engines."""
+    moto = rng.random(N) < 0.4
+    a = np.where(moto, params.moto_l, params.car_l)
+    b = np.where(moto, params.moto_w, params.car_w)
+    x = rng.uniform(-params.L / 2, params.L / 2, N)
+    y = rng.uniform(-params.lane + b, params.lane - b)
+    theta = rng.uniform(-0.3, 0.3, N)
+    return x, y, theta, a, b, np.arange(1, N + 1)
+
+
+def rad(x, y, theta, a, b):
+    """Normalized radii of the cells of the background grid, as in main."""
+    cos_angle = cos(pi - theta)
+    sin_angle = sin(pi - theta)
+    xc = params.xv - x
+    yc = params.yv - y
+    xct = xc * cos_angle - yc * sin_angle
+    yct = xc * sin_angle + yc * cos_angle
+    return xct**2 / a**2 + yct**2 / b**2
+
+
+def legacy(x, y, theta, a, b, ID):
+    """Interactions of every agent, with one matrix per ego and its periodic images as in main."""
+    N = len(x)
+    layers = [(n, 0.0) for n in range(N)]
+    for n in range(N):
+        if x[n] < -(params.L / 2 - (params.d_max + a[n])):
+            layers.append((n, params.L))
+        elif x[n] > params.L / 2 - (params.d_max + a[n]):
+            layers.append((n, -params.L))
+    rads = [(n, rad(x[n] + shift, y[n], theta[n], a[n], b[n])) for n, shift in layers]
+    interactions = []
+    for n in range(N):
+        matrix = np.zeros(params.shape)
+        matrix[[0, -1]] = 1
+        for m, image in rads:
+            if m != n:
+                matrix = identify(matrix, image, ID[m])
+        origin = np.unravel_index(rads[n][1].argmin(), params.shape)
+        interactions.append(shadowcasting(matrix, origin, params.grid, params.L, params.d_max))
+    return interactions
+
+
+def paint(raster, x, y, theta, a, b, ID):
+    """Rasterize the agents and their ghosts once, as in evolve, and return the origins of the agents."""
+    N = len(x)
+    raster.reset()
+    ghost_indices, ghost_shifts = ghosts(x, a + params.grid, params.L)
+    origins = []
+    for n, shift in [(n, 0.0) for n in range(N)] + list(zip(ghost_indices, ghost_shifts)):
+        origin = raster.ellipse(x[n] + shift, y[n], theta[n], a[n], b[n], ID[n])
+        if len(origins) < N:
+            origins.append(origin)
+    return origins
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_horizon(seed):
+    """The shared raster gives the interactions of the per-ego matrices of main."""
+    rng = np.random.default_rng(seed)
+    raster = Raster(params.xv, params.yv)
+    for _ in range(5):
+        x, y, theta, a, b, ID = scene(rng, 16)
+        origins = paint(raster, x, y, theta, a, b, ID)
+        for n, ref in enumerate(legacy(x, y, theta, a, b, ID)):
+            found = horizon(raster.top, raster.prev, ID[n], origins[n], params.grid, params.L, params.d_max)
+            assert found.tolist() == ref.tolist()
+
+
+def sampling(n, x, y, theta, a, b, ID):
+    """Visible agents ahead of an ego, sweeping the bearings of the nearer agents on a fine grid."""
+    bearings = np.linspace(-pi, pi, 72000, endpoint=False)
+    coverage = np.zeros(len(bearings), dtype=bool)
+    agents = []
+    for j in range(len(x)):
+        dx = (x[j] - x[n] + params.L / 2) % params.L - params.L / 2
+        extent = np.hypot(a[j] * cos(theta[j]), b[j] * sin(theta[j]))
+        if j != n and dx + extent > 0 and dx - extent < params.d_max:
+            agents.append((np.hypot(dx, y[j] - y[n]), j, x[n] + dx))
+    visible = []
+    for _, j, x_j in sorted(agents):
+        lo, hi = subtend(x[n], y[n], x_j, y[j], theta[j], a[j], b[j])
+        if np.isnan(lo):
+            visible.append(ID[j])
+            continue
+        mask = (bearings - lo) % (2 * pi) <= hi - lo
+        if (mask & ~coverage).any():
+            visible.append(ID[j])
+        coverage |= mask
+    return sorted(visible)
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_occlusion(seed):
+    """An agent is visible if some bearing of its ellipse is not hidden by a nearer agent."""
+    rng = np.random.default_rng(seed)
+    for _ in range(10):
+        x, y, theta, a, b, ID = scene(rng, 16)
+        # Crowd the ego, so that agents hide each other and some lie behind it
+        x = x / 3
+        for n in range(len(x)):
+            found = occlusion(n, x, y, theta, a, b, ID, params.L, params.d_max, np.arange(len(x)))
+            assert found.tolist() == sampling(n, x, y, theta, a, b, ID)
+
+
+@pytest.fixture(scope="module")
+def rays():
+    return build(params.L, params.lane, params.grid, params.d_max)
+
+
+def test_templates_cache(tmp_path, rays):
+    """The cached templates are those built."""
+    for _ in range(2):
+        cached = templates(params.L, params.lane, params.grid, params.d_max, cache=str(tmp_path))
+        for array, ref in zip(cached, rays):
+            np.testing.assert_array_equal(array, ref)
+    assert len(list(tmp_path.iterdir())) == 1
+
+
+def test_cast(rays):
+    """The ray templates mostly agree with shadowcasting, and never see past an empty road."""
+    cells, offsets, rows = rays
+    raster = Raster(params.xv, params.yv)
+    raster.reset()
+    assert len(cast(raster.top, raster.prev, 1, (params.shape[0] // 2, 10), cells, offsets, rows)) == 0
+    rng = np.random.default_rng(0)
+    agree = total = 0
+    for _ in range(20):
+        x, y, theta, a, b, ID = scene(rng, 16)
+        origins = paint(raster, x, y, theta, a, b, ID)
+        for n in range(len(x)):
+            found = cast(raster.top, raster.prev, ID[n], origins[n], cells, offsets, rows)
+            ref = horizon(raster.top, raster.prev, ID[n], origins[n], params.grid, params.L, params.d_max)
+            agree += found.tolist() == ref.tolist()
+            total += 1
+    assert agree >= 0.9 * total